@@ -6,7 +6,7 @@ from easyconnect.types import pymysql
 
 
 class MSSQL_TEST(MSSQL):
-    _pool: ConnectionPool = ConnectionPool(partial(pypyodbc.connect, f'DRIVER={MSSQL._driver};SERVER={""};UID={""};PWD={""};DATABASE={""};APP={""}'))
+    _pool: ConnectionPool = ConnectionPool(partial(pypyodbc.connect, f'DRIVER={MSSQL._driver};SERVER={""};UID={""};PWD={""};DATABASE={""};APP={""}'), max_size=10, checkout_timeout=30)
 
 
 class MYSQL_TEST(MYSQL):
@@ -0,0 +1,52 @@
+from typing import Optional, Tuple
+
+
+class Autoscaler:
+    def __init__(self, min_size: int = 1, max_size: int = 50, wait_target: float = 0.01, latency_tolerance: float = 1.5, idle_fraction: float = 0.5, step: int = 1, smoothing: float = 0.3, cooldown: int = 3):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.wait_target = wait_target  # grow while the average checkout wait stays above this many seconds
+        self.latency_tolerance = latency_tolerance  # shrink once query latency climbs this far above its baseline, the server is contended
+        self.idle_fraction = idle_fraction  # shrink while more than this share of the pool sits idle
+        self.step = step
+        self.smoothing = smoothing  # weight of the newest sample in the moving averages, lower damps harder
+        self.cooldown = cooldown  # sweeps to hold a size after changing it
+        self.wait = self.latency = self.baseline = None
+        self.idle = 0.0
+        self._last_wait, self._last_hold = (0.0, 0), (0.0, 0)
+        self._hold_off = 0
+
+    def _ewma(self, current: Optional[float], sample: float) -> float:
+        return sample if current is None else current + self.smoothing * (sample - current)
+
+    @staticmethod
+    def _window(snapshot: dict, last: Tuple[float, int]) -> Tuple[Optional[float], Tuple[float, int]]:
+        # average of the observations made since the previous sweep
+        total, count = snapshot['sum'], snapshot['count']
+        return ((total - last[0]) / (count - last[1]) if count > last[1] else None), (total, count)
+
+    def tick(self, stats: dict) -> int:
+        wait, self._last_wait = self._window(stats['checkout_wait'], self._last_wait)
+        hold, self._last_hold = self._window(stats['hold_time'], self._last_hold)
+        if wait is not None:
+            self.wait = self._ewma(self.wait, wait)
+        if hold is not None:
+            self.latency = self._ewma(self.latency, hold)
+            # the baseline follows improvements at once and degradations only slowly
+            self.baseline = self.latency if self.baseline is None or self.latency < self.baseline else self.baseline + (self.latency - self.baseline) * self.smoothing / 10
+        self.idle = self._ewma(self.idle, stats['idle'] / stats['total'] if stats['total'] else 0.0)
+        size = min(max(stats['max_size'] or self.min_size, self.min_size), self.max_size)
+        if self._hold_off:
+            self._hold_off -= 1
+            return size
+        target = size
+        if self.latency is not None and self.baseline and self.latency > self.baseline * self.latency_tolerance:
+            target = size - self.step
+        elif self.wait is not None and self.wait > self.wait_target and stats['waiting'] + stats['in_use'] >= size:
+            target = size + self.step
+        elif self.idle > self.idle_fraction:
+            target = size - self.step
+        target = min(max(target, self.min_size), self.max_size)
+        if target != size:
+            self._hold_off = self.cooldown
+        return target
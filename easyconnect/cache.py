@@ -0,0 +1,93 @@
+from collections import OrderedDict
+from sys import getsizeof
+from threading import Lock
+from time import monotonic
+from typing import Any, FrozenSet, Hashable, Optional, Tuple
+
+COUNTERS = {
+    'hits': 'Reads answered from the query cache.',
+    'misses': 'Reads that went to the database.',
+    'evictions': 'Cached results dropped to stay within max_entries/max_bytes.',
+    'invalidations': 'Cached results dropped after a write to a table they read.',
+}
+
+
+def _size(value) -> int:
+    # rough deep size, only used to keep the cache under max_bytes
+    if isinstance(value, dict):
+        return getsizeof(value) + sum(getsizeof(k) + _size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return getsizeof(value) + sum(_size(v) for v in value)
+    return getsizeof(value)
+
+
+def _copy(value):
+    # rows are copied in and out so callers can't change what is cached
+    if isinstance(value, list):
+        return [dict(row) if isinstance(row, dict) else row for row in value]
+    return dict(value) if isinstance(value, dict) else value
+
+
+class QueryCache:
+    def __init__(self, ttl: float = 60, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (expires, size, tables, result), least recently used first
+        self.bytes = 0
+        self.generations = {}  # owner -> writes invalidated so far, None counts the ones that cleared every owner
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.__lock = Lock()
+
+    def _drop(self, key: Hashable):
+        self.bytes -= self.entries.pop(key)[1]
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        with self.__lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] <= monotonic():
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.counters['misses'] += 1
+                return False, None
+            self.entries.move_to_end(key)
+            self.counters['hits'] += 1
+        return True, _copy(entry[3])
+
+    def generation(self, owner: Any) -> Tuple[int, int]:
+        # taken before a read, put drops the result if owner saw a write since
+        with self.__lock:
+            return self.generations.get(None, 0), self.generations.get(owner, 0)
+
+    def put(self, key: Hashable, result: Any, tables: FrozenSet[str] = frozenset(), generation: Optional[Tuple[int, int]] = None):
+        size = _size(result)
+        if size > self.max_bytes:
+            return
+        result = _copy(result)
+        with self.__lock:
+            if generation is not None and generation != (self.generations.get(None, 0), self.generations.get(key[0], 0)):
+                return
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = (monotonic() + self.ttl, size, tables, result)
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._drop(next(iter(self.entries)))
+                self.counters['evictions'] += 1
+
+    def invalidate(self, owner: Any = None, tables: FrozenSet[str] = frozenset()):
+        # drops owner's entries that read any of tables, or every entry of owner when tables is empty, or everything when owner is None
+        # entries whose tables couldn't be worked out are dropped on any write by their owner
+        with self.__lock:
+            self.generations[owner] = self.generations.get(owner, 0) + 1
+            for key in [k for k, e in self.entries.items() if (owner is None or k[0] is owner) and (not tables or not e[2] or e[2] & tables)]:
+                self._drop(key)
+                self.counters['invalidations'] += 1
+
+    def clear(self):
+        self.invalidate()
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return {**self.counters, 'entries': len(self.entries), 'bytes': self.bytes}
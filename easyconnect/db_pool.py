@@ -1,186 +1,1135 @@
+import asyncio
 import json
+import re
+import weakref
+from collections import deque
 from collections.abc import Iterable
-from functools import partial
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from contextvars import ContextVar
+from functools import lru_cache, partial
+from itertools import islice
+from math import ceil, inf
+from os import getpid, O_NONBLOCK, O_RDONLY, close, open as os_open, path as os_path
 from platform import system
-from threading import Lock, Thread
-from time import sleep
-from typing import List, Dict, Any, Optional, Callable
+from random import random
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Event, Lock, Thread, local
+from time import monotonic, sleep
+from traceback import extract_stack, format_list
+from typing import List, Dict, Any, Optional, Callable, Tuple, AsyncIterator, Iterator, FrozenSet, Hashable
 
+from easyconnect.autoscale import Autoscaler
+from easyconnect.cache import QueryCache, _copy
+from easyconnect.deferred import WriteBehind
+from easyconnect.metrics import PoolMetrics
 from easyconnect.types import pymysql, pypyodbc
 
+try:
+    from os import mkfifo
+except ImportError:
+    mkfifo = None
+
 SERVERS = {}
+_TABLE_NAME = r'(?:[`"\[]?[\w$#]+[`"\]]?\s*\.\s*)*[`"\[]?[\w$#]+'
+_TABLE_HINT = r'\s+WITH\s*\((?:[^()]|\([^()]*\))*\)'  # MSSQL WITH (NOLOCK, INDEX(ix)) after a table or its alias
+_TABLE_REFERENCE = re.compile(rf'\b(?:INTO\s+TABLE|FROM|JOIN|INTO|UPDATE|TABLE)\s+({_TABLE_NAME}(?:(?:\s+(?:AS\s+)?[\w$#]+)?(?:{_TABLE_HINT})?\s*,\s*{_TABLE_NAME})*)', re.IGNORECASE)  # FROM a x, b y lists every table
+_WORD = re.compile(r'[\w$#]+')
+_MYSQL_TOKENS = re.compile(r"""'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*"|`[^`]*`|(?:--(?=\s)|\#)[^\n]*|/\*.*?\*/|%%|%s|%\(\w+\)s|[?%]""", re.DOTALL)
+_transactions: ContextVar = ContextVar('easyconnect_transactions', default={})  # pool -> (connection, nesting depth, (class, sql) written so far) of the open transactions
+_flights = {}
+_flights_lock = Lock()
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class _AsyncEvent:
+    # stands in for threading.Event so a coroutine can wait for a checkout without holding a thread
+    def __init__(self, loop):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.flag = False
+
+    def set(self):
+        self.flag = True
+        self.loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+    def is_set(self) -> bool:
+        return self.flag
+
+
+@lru_cache(maxsize=1024)
+def _mysql_sql(sql: str, formatted: bool) -> str:
+    # ? placeholders become %s outside literals and comments, pymysql only %-formats the query when it has params so only then are other %s escaped
+    def token(match):
+        text = match.group()
+        if text == '?':
+            return '%s'
+        if text == '%':
+            return '%%' if formatted else text
+        if text[0] == '%':  # already a pymysql placeholder or escape
+            return text
+        return re.sub('%%?', '%%', text) if formatted else text
+
+    return _MYSQL_TOKENS.sub(token, sql)
+
+
+class _Flight:
+    # a read that identical concurrent reads wait on instead of running it again
+    def __init__(self, key: Hashable):
+        self.key = key
+        self.event = Event()
+        self.events = []  # _AsyncEvents of waiting coroutines
+        self.result = self.error = None
+
+    def finish(self, result: Any = None, error: Optional[BaseException] = None):
+        self.result, self.error = _copy(result), error
+        with _flights_lock:
+            del _flights[self.key]
+            self.event.set()
+        for event in self.events:
+            event.set()
+
+    def _outcome(self):
+        if self.error is not None:
+            raise self.error
+        return _copy(self.result)
+
+    def wait(self):
+        self.event.wait()
+        return self._outcome()
+
+    async def await_result(self):
+        with _flights_lock:
+            event = None if self.event.is_set() else _AsyncEvent(asyncio.get_event_loop())
+            if event is not None:
+                self.events.append(event)
+        if event is not None:
+            await event.future
+        return self._outcome()
+
+
+class _Waiter:
+    def __init__(self, event=None):
+        self.event = event or Event()
+        self.conn = None  # set when a connection is handed over, left as None when granted a slot to open a new one
+        self.cancelled = False
+        self.lane = None
+
+
+def _maintain(ref):
+    # holds only a weak reference between sweeps so an unused pool can still be collected
+    while True:
+        pool = ref()
+        if pool is None:
+            return
+        interval = pool.maintenance_interval
+        del pool
+        sleep(interval)
+        pool = ref()
+        if pool is None:
+            return
+        try:
+            pool.maintain()
+        except Exception as e:
+            print(f'[POOL] maintenance failed: {e!r}')
+        del pool
 
 
 class TmpConnection:
-    def __init__(self, pool):
+    def __init__(self, pool, lane: Optional[str] = None):
         self.pool = pool
+        self.lane = lane
 
     def __enter__(self):
-        self.con = self.pool.get_connection()
+        self.con = self.pool.get_connection(lane=self.lane)
         return self.con
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if isinstance(exc_type, (pymysql.OperationalError, pypyodbc.InterfaceError, pymysql.InternalError)):
-            self.con.close()
-            self.pool.running.remove(self.con)
-            self.pool.connections.remove(self.con)
-        elif isinstance(exc_type, pypyodbc.Error):
+        # every path hands the connection back, anything else leaks it out of the pool
+        if exc_type is not None and issubclass(exc_type, (pymysql.OperationalError, pypyodbc.InterfaceError, pymysql.InternalError)):
+            self.pool.discard(self.con)
+        elif exc_type is not None and issubclass(exc_type, pypyodbc.Error) and 'Connection is busy' in repr(exc_val):
             def free():
                 sleep(5)
                 self.pool.free_connection(self.con)
 
-            if 'Connection is busy' in exc_val:
-                Thread(target=free).start()
+            Thread(target=free, daemon=True).start()
         else:
             self.pool.free_connection(self.con)
-            return False
-        return True
+        return False
 
 
 class TmpCursor(TmpConnection):
     def __enter__(self):
-        self.con = self.pool.get_connection()
-        self.cursor = self.con.cursor()
+        self.con = self.pool.get_connection(lane=self.lane)
+        try:
+            self.cursor = self.con.cursor()
+        except BaseException as e:
+            super().__exit__(type(e), e, e.__traceback__)
+            raise
         return self.cursor.__enter__()
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.cursor.__exit__(exc_type, exc_val, exc_tb)
+        try:
+            self.cursor.__exit__(exc_type, exc_val, exc_tb)
+        except BaseException as e:
+            super().__exit__(type(e), e, e.__traceback__)
+            raise
         return super().__exit__(exc_type, exc_val, exc_tb)
 
 
+class Transaction:
+    def __init__(self, db, savepoint: bool = True, lane: Optional[str] = None):
+        self.db = db
+        self.savepoint = savepoint
+        self.lane = lane
+        self.name = None
+
+    def __enter__(self):
+        pool = self.db._pool
+        pinned = _transactions.get()
+        if pool in pinned:
+            self.con, depth, writes = pinned[pool]
+            if self.savepoint:
+                self.name = f'easyconnect_{depth}'
+                # with no statement run yet the implicit transaction hasn't started and SAVE TRANSACTION fails, BEGIN TRANSACTION counts twice in implicit mode so the extra level is dropped
+                self._execute('IF @@TRANCOUNT = 0 BEGIN BEGIN TRANSACTION; IF @@TRANCOUNT > 1 COMMIT TRANSACTION END; SAVE TRANSACTION {}' if issubclass(self.db, MSSQL) else 'SAVEPOINT {}')
+            depth += 1
+        else:
+            self.con, depth, writes = pool.get_connection(lane=self.lane), 1, []
+            if issubclass(self.db, MYSQL):
+                try:
+                    self.con.begin()
+                except (pymysql.OperationalError, pymysql.InternalError):
+                    pool.discard(self.con)
+                    raise
+                except BaseException:
+                    pool.free_connection(self.con)
+                    raise
+            # pypyodbc and pyodbc connections already run in a transaction unless opened with autocommit
+        self.token = _transactions.set({**pinned, pool: (self.con, depth, writes)})
+        return self.con
+
+    def _execute(self, sql: str):
+        cursor = self.con.cursor()
+        try:
+            cursor.execute(sql.format(self.name))
+        finally:
+            cursor.close()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        writes = _transactions.get()[self.db._pool][2]
+        _transactions.reset(self.token)
+        if _transactions.get().get(self.db._pool) is not None:  # nested, the outermost block commits
+            if self.name is not None:
+                if exc_type is not None:
+                    self._execute('ROLLBACK TRANSACTION {}' if issubclass(self.db, MSSQL) else 'ROLLBACK TO SAVEPOINT {}')
+                elif issubclass(self.db, MYSQL):
+                    self._execute('RELEASE SAVEPOINT {}')
+            return False
+        try:
+            if exc_type is None:
+                self.con.commit()
+            else:
+                self.con.rollback()
+        except (pymysql.OperationalError, pypyodbc.InterfaceError, pymysql.InternalError):
+            self.db._pool.discard(self.con)
+            raise
+        except BaseException:
+            self.db._pool.free_connection(self.con)
+            raise
+        finally:
+            # reads by other connections between a write and the commit may have cached the rows it replaced
+            for db, sql in writes:
+                db._invalidate(sql)
+        self.db._pool.free_connection(self.con)
+        return False
+
+
 class ConnectionPool:
-    def __init__(self, connect):
+    def __init__(self, connect, max_size: int = 0, checkout_timeout: Optional[float] = None, min_idle: int = 0, max_idle_time: Optional[float] = None, max_lifetime: Optional[float] = None, maintenance_interval: float = 30, validate_idle: Optional[float] = None, leak_threshold: Optional[float] = None, leak_trace: bool = False, leak_policy: str = 'warn', reserved: Optional[Dict[str, int]] = None, shed: Iterable = (), autoscale: Optional[Autoscaler] = None):
         self.connect = connect
-        self.connections, self.running, self.free = [], [], []
-        self.__lock = Lock()
+        self.max_size = max_size  # 0 means unbounded
+        self.checkout_timeout = checkout_timeout  # None waits forever
+        self.min_idle = min_idle
+        self.max_idle_time = max_idle_time  # idle connections above min_idle are closed after this many seconds
+        self.max_lifetime = max_lifetime  # connections are replaced after roughly this many seconds, jittered so they don't all reconnect together
+        self.maintenance_interval = maintenance_interval
+        self.validate_idle = validate_idle  # connections idle longer than this many seconds are pinged before being handed out
+        self.leak_threshold = leak_threshold  # connections checked out longer than this many seconds are reported as leaked
+        self.leak_trace = leak_trace  # remember the checkout stack so leak reports show who took the connection
+        self.leak_policy = leak_policy  # 'warn' only reports, 'reclaim' frees the slot and closes the connection once returned, 'close' closes it straight away
+        self.reserved = dict(reserved or {})  # lane -> connections guaranteed to it (its own checkouts count towards it), only enforced when max_size is set
+        self.shed = set(shed)  # lanes that fail fast with PoolExhausted instead of waiting when they can't be admitted
+        self.autoscale = autoscale  # moves max_size within its bounds on every maintenance sweep
+        if autoscale is not None:
+            self.max_size = min(max(max_size, autoscale.min_size), autoscale.max_size)
+        self.inherited = set()  # connections copied from a parent process, referenced forever so the driver never closes the parent's session
         self.num = 0
+        self._reset()
 
-    def __del__(self):
-        [c.close() for c in self.connections]
+    def _reset(self):
+        self.pid = getpid()
+        self.connections = set()
+        self.running = {}  # connection -> time it was checked out
+        self.free = {}  # connection -> time it was returned, insertion ordered so popitem hands out the most recently used
+        self.expires = {}  # connection -> monotonic deadline when max_lifetime is set
+        self.traces, self.leaked = {}, set()
+        self.lanes, self.lane_use = {}, {}  # connection -> lane and lane -> connections in use, only kept when lanes are reserved
+        self.maintainer = None
+        self._executor = None
+        self.waiters = deque()
+        self.opening = 0
+        self.__lock = Lock()
+        self._local = local()
+        self.metrics = PoolMetrics()
 
-    def connection(self) -> TmpConnection:
-        return TmpConnection(self)
+    def _after_fork(self):
+        # the lock, maintenance thread and sockets/handles all belong to the parent, start over lazily in this process
+        self.inherited.update(self.connections)
+        self._reset()
 
-    def cursor(self) -> TmpCursor:
-        return TmpCursor(self)
+    def __del__(self):
+        if self.pid == getpid():
+            [c.close() for c in self.connections]
 
-    def free_connection(self, conn):
-        self.running.remove(conn)
-        self.free.append(conn)
+    def connection(self, lane: Optional[str] = None) -> TmpConnection:
+        return TmpConnection(self, lane)
 
-    def get_connection(self):
-        try:
+    def cursor(self, lane: Optional[str] = None) -> TmpCursor:
+        return TmpCursor(self, lane)
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        # blocking driver calls for the async API run here, sized to the pool so it never needs more threads than connections
+        if self._executor is None:
             with self.__lock:
-                conn = self.free.pop()
-        except IndexError:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor((self.autoscale.max_size if self.autoscale else self.max_size) or 32, 'easyconnect')
+        return self._executor
+
+    def _has_capacity(self) -> bool:
+        return not self.max_size or len(self.connections) + self.opening < self.max_size
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        # called with the lock held, timed out waiters are only flagged so they get dropped here instead of searched for
+        while self.waiters and self.waiters[0].cancelled:
+            self.waiters.popleft()
+        return self.waiters[0] if self.waiters else None
+
+    def _admits(self, lane: Optional[str], extra: int = 0) -> bool:
+        # called with the lock held, extra counts a connection being checked in that is not in free yet
+        if not (self.reserved and self.max_size):
+            return bool(self.free or extra) or self._has_capacity()
+        available = len(self.free) + extra + self.max_size - len(self.connections) - self.opening
+        held_back = sum(max(0, n - self.lane_use.get(name, 0)) for name, n in self.reserved.items() if name != lane)
+        return available - held_back >= 1
+
+    def _pop_waiter(self, extra: int = 0) -> Optional[_Waiter]:
+        # called with the lock held, returns the oldest waiter allowed to take a connection, without lanes only the head can be
+        if self._next_waiter() is None:
+            return None
+        for i, waiter in enumerate(self.waiters):
+            if not waiter.cancelled and self._admits(waiter.lane, extra):
+                del self.waiters[i]
+                return waiter
+            if not self.reserved:
+                break
+        return None
+
+    def _grant(self) -> bool:
+        # called with the lock held whenever capacity frees up, lets the oldest admissible waiter open a new connection
+        if self._has_capacity():
+            waiter = self._pop_waiter()
+            if waiter is not None:
+                self.opening += 1
+                waiter.event.set()
+                return True
+        return False
+
+    def _open(self, checkout: bool = True, lane: Optional[str] = None):
+        with self.__lock:
             self.num += 1
+            num = self.num
+        try:
             if self.connect.keywords.get('program_name'):
                 kw = dict(self.connect.keywords)
-                kw['program_name'] += f' {self.num}'
+                kw['program_name'] += f' {num}'
                 conn = self.connect.func(**kw)
             else:
-                conn = self.connect.func(self.connect.args[0] + f' {self.num}')
-            self.connections.append(conn)
-        self.running.append(conn)
+                conn = self.connect.func(self.connect.args[0] + f' {num}')
+        except BaseException:
+            with self.__lock:
+                self.opening -= 1
+                self._grant()
+            raise
+        with self.__lock:
+            self.opening -= 1
+            self.connections.add(conn)
+            self.metrics.incr('created')
+            if self.max_lifetime:
+                self.expires[conn] = monotonic() + self.max_lifetime * (1 - random() / 5)
+            if (self.min_idle or self.max_idle_time or self.max_lifetime or self.leak_threshold or self.autoscale) and self.maintainer is None:
+                self.maintainer = Thread(target=_maintain, args=(weakref.ref(self),), daemon=True)
+                self.maintainer.start()
+            if checkout:
+                self._track(conn, lane)
+            else:
+                self._checkin(conn)
         return conn
 
+    def warm(self, count: Optional[int] = None, threads: int = 4, wait: bool = True) -> int:
+        if self.pid != getpid():
+            self._after_fork()
+        with self.__lock:
+            todo = max(0, (self.min_idle if count is None else count) - len(self.free) - self.opening)
+            if self.max_size:
+                todo = max(0, min(todo, self.max_size - len(self.connections) - self.opening))
+            self.opening += todo
+        remaining, errors = [todo], []
+
+        def work():
+            while True:
+                with self.__lock:
+                    if not remaining[0]:
+                        return
+                    remaining[0] -= 1
+                try:
+                    self._open(checkout=False)
+                except Exception as e:
+                    errors.append(e)
+
+        workers = [Thread(target=work, daemon=True) for _ in range(min(threads, todo))]
+        [worker.start() for worker in workers]
+        if wait:
+            [worker.join() for worker in workers]
+            if errors:
+                raise errors[0]
+        return todo
+
+    def resize(self, max_size: int):
+        with self.__lock:
+            self.max_size = max_size
+            while self._grant():
+                pass
+            # shrink by closing the longest idle connections, busy ones are left to finish
+            excess = [conn for conn in islice(list(self.free), max(0, len(self.connections) + self.opening - max_size)) if self.free.pop(conn, None) is not None]
+            for conn in excess:
+                self._forget(conn)
+        for conn in excess:
+            self._close(conn)
+
+    def maintain(self):
+        if self.autoscale is not None:
+            size = self.autoscale.tick(self.stats())
+            if size != self.max_size:
+                self.resize(size)
+        now = monotonic()
+        with self.__lock:
+            idle, stale = len(self.free), []
+            recycle = ceil(len(self.connections) / 4)  # cap lifetime replacements per sweep to stagger reconnects
+            for conn, since in list(self.free.items()):  # copied since checkouts can claim entries without the lock
+                if recycle and self.expires.get(conn, inf) <= now:
+                    recycle -= 1
+                elif not (self.max_idle_time and now - since >= self.max_idle_time and idle - len(stale) > self.min_idle):
+                    continue
+                stale.append(conn)
+            # only retire what is still idle, a checkout may have taken it since the copy
+            stale = [conn for conn in stale if self.free.pop(conn, None) is not None]
+            for conn in stale:
+                self._forget(conn)
+            leaks = []
+            if self.leak_threshold:
+                leaks = [(conn, now - since, self.traces.get(conn)) for conn, since in list(self.running.items()) if now - since >= self.leak_threshold and conn not in self.leaked]
+                for conn, _, _ in leaks:
+                    self.metrics.incr('leaks')
+                    if self.leak_policy == 'warn':
+                        self.leaked.add(conn)
+                    else:
+                        self._forget(conn)
+        for conn in stale:
+            self._close(conn)
+        for conn, held, trace in leaks:
+            print(f'[POOL] connection checked out for {held:.1f}s, policy {self.leak_policy}' + (f', taken at:\n{trace}' if trace else ''))
+            if self.leak_policy == 'close':
+                self._close(conn)
+        if self.min_idle:
+            self.warm()
+
+    def _close(self, conn):
+        if conn in self.inherited:
+            return
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _forget(self, conn):
+        # called with the lock held
+        if conn in self.connections:
+            self.metrics.incr('destroyed')
+        self._untrack(conn)
+        self.connections.discard(conn)
+        self.free.pop(conn, None)
+        self.expires.pop(conn, None)
+        self._grant()
+
+    def _track(self, conn, lane: Optional[str] = None):
+        self.running[conn] = monotonic()
+        if self.reserved:
+            self.lanes[conn] = lane
+            self.lane_use[lane] = self.lane_use.get(lane, 0) + 1
+        if self.leak_trace:
+            self.traces[conn] = ''.join(format_list([frame for frame in extract_stack() if frame.filename != __file__]))
+
+    def _untrack(self, conn) -> Optional[float]:
+        # called with the lock held, returns when the connection was checked out or None if it wasn't
+        since = self.running.pop(conn, None)
+        self.traces.pop(conn, None)
+        self.leaked.discard(conn)
+        if since is not None and self.reserved:
+            self.lane_use[self.lanes.pop(conn)] -= 1
+        return since
+
+    def discard(self, conn):
+        self._close(conn)
+        with self.__lock:
+            self._forget(conn)
+
+    def _checkin(self, conn) -> bool:
+        # called with the lock held, hands the connection straight to the oldest admissible waiter if there is one
+        waiter = self._pop_waiter(extra=1)
+        if waiter is not None:
+            waiter.conn = conn
+            self._track(conn, waiter.lane)
+            waiter.event.set()
+            return False
+        self.free[conn] = monotonic()
+        return True
+
+    def free_connection(self, conn):
+        if self.pid != getpid():
+            self._after_fork()
+        with self.__lock:
+            since = self._untrack(conn)
+            if since is None:
+                if conn in self.connections:
+                    raise KeyError(conn)
+                expired = True  # reclaimed as a leak, no longer belongs to the pool
+            else:
+                now = monotonic()
+                self.metrics.hold_time.observe(now - since)
+                # past max_size after a shrink, busy connections are retired as they come back
+                expired = self.expires.get(conn, inf) <= now or bool(self.max_size) and len(self.connections) > self.max_size
+            if expired:
+                self._forget(conn)
+            elif not self._checkin(conn):
+                return
+        if expired:
+            self._close(conn)
+        else:
+            self._local.conn = conn
+
+    @staticmethod
+    def ping(conn) -> bool:
+        try:
+            if hasattr(conn, 'ping'):  # pymysql
+                conn.ping(reconnect=False)
+            else:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute('SELECT 1')
+                    cursor.fetchone()
+                finally:
+                    cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        with self.__lock:
+            stats = {'leaked': len(self.leaked), 'in_use': len(self.running), 'idle': len(self.free), 'total': len(self.connections), 'opening': self.opening, 'waiting': sum(not w.cancelled for w in self.waiters), 'max_size': self.max_size, 'lanes': dict(self.lane_use)}
+        stats.update(self.metrics.snapshot())
+        return stats
+
+    def get_connection(self, timeout: Optional[float] = None, lane: Optional[str] = None):
+        if self.pid != getpid():
+            self._after_fork()
+        start = monotonic()
+        while True:
+            conn, since = self._checkout(timeout, lane)
+            # only connections that sat idle past the threshold are pinged, busy ones go straight back out
+            if since is None or self.validate_idle is None or monotonic() - since < self.validate_idle or self.ping(conn):
+                self.metrics.checkout_wait.observe(monotonic() - start)
+                return conn
+            self.discard(conn)
+
+    def _checkout(self, timeout: Optional[float], lane: Optional[str]) -> Tuple[Any, Optional[float]]:
+        conn, since, waiter = self._reserve(lane, _Waiter)
+        if conn is not None:
+            return conn, since
+        if waiter is not None:
+            timeout = self.checkout_timeout if timeout is None else timeout
+            if not waiter.event.wait(timeout):
+                self._give_up(waiter, timeout)
+            if waiter.conn is not None:
+                return waiter.conn, None
+        return self._open(lane=lane), None
+
+    def _reserve(self, lane: Optional[str], waiter_factory: Callable[[], _Waiter]) -> Tuple[Any, Optional[float], Optional[_Waiter]]:
+        # returns an idle connection with the time it was returned, a queued waiter, or neither when a slot to open a new connection was reserved
+        conn = getattr(self._local, 'conn', None)
+        # dict.pop is atomic, so a thread can reclaim the connection it last returned without taking the lock, lanes need the lock for admission
+        since = self.free.pop(conn, None) if conn is not None and not self.reserved else None
+        if since is not None:
+            self._track(conn)
+            return conn, since, None
+        with self.__lock:
+            # waiters are only left queued while they can't be admitted, so admitting here doesn't jump the queue
+            if self._admits(lane):
+                if self.free:
+                    conn, since = self.free.popitem()
+                    self._track(conn, lane)
+                    return conn, since, None
+                self.opening += 1
+                return None, None, None
+            if lane in self.shed:
+                self.metrics.incr('exhausted')
+                raise PoolExhausted(f'Pool saturated, shedding {lane} checkout ({len(self.connections)}/{self.max_size} open)')
+            waiter = waiter_factory()
+            waiter.lane = lane
+            self.waiters.append(waiter)
+            return None, None, waiter
+
+    def _give_up(self, waiter: _Waiter, timeout: Optional[float]):
+        # raises unless the waiter was served while timing out, in which case the caller carries on with what it was given
+        with self.__lock:
+            if not waiter.event.is_set():
+                waiter.cancelled = True
+                self.metrics.incr('exhausted')
+                raise PoolExhausted(f'No connection available after {timeout}s ({len(self.connections)}/{self.max_size} open)')
+
+    async def aget_connection(self, timeout: Optional[float] = None, lane: Optional[str] = None):
+        if self.pid != getpid():
+            self._after_fork()
+        loop = asyncio.get_event_loop()
+        start = monotonic()
+        while True:
+            conn, since, waiter = self._reserve(lane, lambda: _Waiter(_AsyncEvent(loop)))
+            if waiter is not None:
+                wait = self.checkout_timeout if timeout is None else timeout
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter.event.future), wait)
+                except asyncio.TimeoutError:
+                    self._give_up(waiter, wait)
+                except asyncio.CancelledError:
+                    with self.__lock:
+                        waiter.cancelled = not waiter.event.is_set()
+                    if waiter.conn is not None:
+                        self.free_connection(waiter.conn)
+                    elif not waiter.cancelled:
+                        with self.__lock:
+                            self.opening -= 1
+                            self._grant()
+                    raise
+                conn = waiter.conn
+            if conn is None:
+                conn = await loop.run_in_executor(self.executor, partial(self._open, lane=lane))
+            elif since is not None and self.validate_idle is not None and monotonic() - since >= self.validate_idle and not await loop.run_in_executor(self.executor, self.ping, conn):
+                await loop.run_in_executor(self.executor, self.discard, conn)
+                continue
+            self.metrics.checkout_wait.observe(monotonic() - start)
+            return conn
+
 
 class DBConnection:
     _pool: ConnectionPool
     success_hooks: List[Callable[[str, Optional[Iterable]], None]] = []
     failure_hooks: List[Callable[[str, Optional[Iterable]], None]] = []
+    max_params = 0  # per statement limits for insert_many, 0 is unbounded
+    max_rows = 0
+    max_packet = 4 * 1024 * 1024  # MySQL 5.7's default max_allowed_packet
+    write_behind: Optional[WriteBehind] = None  # created by the first execute_deferred unless set, one writer can serve several classes
+    cache: Optional[QueryCache] = None  # set to cache fetch/fetchall results, execute invalidates the tables it writes to
+    single_flight = False  # identical concurrent fetch/fetchall calls share one query
+    max_retries = 3  # reconnects or busy connection retries per query before the error is raised
 
     @classmethod
-    def connection(cls) -> TmpConnection:
-        return cls._pool.connection()
+    def connection(cls, lane: Optional[str] = None) -> TmpConnection:
+        return cls._pool.connection(lane)
 
     @classmethod
-    def cursor(cls) -> TmpCursor:
-        return cls._pool.cursor()
+    def cursor(cls, lane: Optional[str] = None) -> TmpCursor:
+        return cls._pool.cursor(lane)
 
     @classmethod
-    def execute(cls, sql: str, params: Optional[Iterable] = None):
-        if issubclass(cls, MYSQL):
-            sql = sql.replace('?', '%s')
-        conn = cls._pool.get_connection()
+    def transaction(cls, savepoint: bool = True, lane: Optional[str] = None) -> Transaction:
+        # pins one connection for the block, execute/fetch/fetchall on this class use it and nested blocks become savepoints
+        return Transaction(cls, savepoint, lane)
+
+    @classmethod
+    def _pinned(cls):
+        return _transactions.get().get(cls._pool, (None,))[0]
+
+    @staticmethod
+    def _run_pinned(conn, action: Callable[[Any], Any]) -> Tuple[Any, bool]:
+        # no retries and no cursor context, pypyodbc cursors commit when they exit
+        cursor = conn.cursor()
         try:
-            with conn.cursor() as cursor:
-                cursor.execute(sql, *([[json.dumps(p) if isinstance(p, dict) else p for p in params]] if params else []))
-            cls._pool.free_connection(conn)
-            [hook(sql, params) for hook in cls.success_hooks]
-        except (pymysql.OperationalError, pypyodbc.InterfaceError, pymysql.InternalError) as e:
-            if isinstance(e, pymysql.InternalError) and 'Packet sequence' not in e.__repr__():
-                raise e
-            conn.close()
-            cls._pool.running.remove(conn)
-            cls._pool.connections.remove(conn)
-            cls.execute(sql, params)
-            [hook(sql, params) for hook in cls.failure_hooks]
-        except pypyodbc.Error as e:
-            if 'Connection is busy' not in repr(e) and 'Invalid cursor state' not in repr(e):
-                raise e
-            cls.execute(sql, params)
+            return action(cursor), False
+        finally:
+            cursor.close()
+
+    @classmethod
+    def _run(cls, action: Callable[[Any], Any], lane: Optional[str] = None) -> Tuple[Any, bool]:
+        pinned = cls._pinned()
+        if pinned is not None:
+            return cls._run_pinned(pinned, action)
+        return cls._run_on(cls._pool.get_connection(lane=lane), action, lane)
+
+    @classmethod
+    async def _arun(cls, action: Callable[[Any], Any], lane: Optional[str] = None) -> Tuple[Any, bool]:
+        pinned = cls._pinned()
+        if pinned is not None:
+            return await asyncio.get_event_loop().run_in_executor(cls._pool.executor, cls._run_pinned, pinned, action)
+        conn = await cls._pool.aget_connection(lane=lane)
+        try:
+            future = asyncio.get_event_loop().run_in_executor(cls._pool.executor, cls._run_on, conn, action, lane)
+        except BaseException:
             cls._pool.free_connection(conn)
-            [hook(sql, params) for hook in cls.failure_hooks]
+            raise
+        return await future
 
     @classmethod
-    def fetch(cls, sql: str, params: Optional[Iterable] = None) -> Dict[str, Any]:
-        if issubclass(cls, MYSQL):
-            sql = sql.replace('?', '%s')
-        conn = cls._pool.get_connection()
+    def _run_on(cls, conn, action: Callable[[Any], Any], lane: Optional[str] = None, retries: Optional[int] = None) -> Tuple[Any, bool]:
+        # runs action(cursor) on a checked out connection and returns (result, retried), the connection is always handed back or discarded
+        retries = cls.max_retries if retries is None else retries
         try:
             with conn.cursor() as cursor:
-                cursor.execute(sql, *([params] if params else []))
-                results = cursor.fetchone() or {}
-            cls._pool.free_connection(conn)
-            return results or {}
+                result = action(cursor)
         except (pymysql.OperationalError, pypyodbc.InterfaceError, pymysql.InternalError) as e:
             if isinstance(e, pymysql.InternalError) and 'Packet sequence' not in e.__repr__():
+                cls._pool.free_connection(conn)
                 raise e
-            conn.close()
-            results = cls.fetch(sql, params)
-            cls._pool.running.remove(conn)
-            cls._pool.connections.remove(conn)
-            return results or {}
+            cls._pool.discard(conn)
+            if retries <= 0:
+                raise e
+            cls._pool.metrics.incr('reconnects', 'retries')
+            return cls._run_on(cls._pool.get_connection(lane=lane), action, lane, retries - 1)[0], True
         except pypyodbc.Error as e:
-            if 'Connection is busy' not in repr(e) and 'Invalid cursor state' not in repr(e):
+            if retries <= 0 or 'Connection is busy' not in repr(e) and 'Invalid cursor state' not in repr(e):
+                cls._pool.free_connection(conn)
                 raise e
-            results = cls.fetch(sql, params)
+            try:
+                # taken before the busy connection goes back, the thread's fast path would hand that one straight out again
+                retry = cls._pool.get_connection(lane=lane)
+            finally:
+                cls._pool.free_connection(conn)
+            cls._pool.metrics.incr('retries')
+            return cls._run_on(retry, action, lane, retries - 1)[0], True
+        except BaseException:
             cls._pool.free_connection(conn)
-            return results or {}
+            raise
+        cls._pool.free_connection(conn)
+        return result, False
+
+    @classmethod
+    def _sql(cls, sql: str, params: Optional[Iterable] = None) -> str:
+        return _mysql_sql(sql, bool(params)) if issubclass(cls, MYSQL) else sql
+
+    @staticmethod
+    def _writer(sql: str, params: Optional[Iterable]) -> Callable[[Any], Any]:
+        args = [[json.dumps(p) if isinstance(p, dict) else p for p in params]] if params else []
+        return lambda cursor: cursor.execute(sql, *args)
+
+    @staticmethod
+    def _reader(sql: str, params: Optional[Iterable], method: str) -> Callable[[Any], Any]:
+        def action(cursor):
+            cursor.execute(sql, *([params] if params else []))
+            return getattr(cursor, method)()
+
+        return action
 
     @classmethod
-    def fetchall(cls, sql: str, params: Optional[Iterable] = None) -> List[Dict[str, Any]]:
-        if issubclass(cls, MYSQL):
-            sql = sql.replace('?', '%s')
-        conn = cls._pool.get_connection()
+    def _hooks(cls, sql: str, params: Optional[Iterable], retried: bool):
+        [hook(sql, params) for hook in cls.success_hooks]
+        if retried:
+            [hook(sql, params) for hook in cls.failure_hooks]
+
+    @classmethod
+    def execute(cls, sql: str, params: Optional[Iterable] = None, lane: Optional[str] = None):
+        sql = cls._sql(sql, params)
+        retried = cls._run(cls._writer(sql, params), lane)[1]
+        cls._invalidate(sql)
+        cls._hooks(sql, params, retried)
+
+    @classmethod
+    def execute_deferred(cls, sql: str, params: Optional[Iterable] = None) -> Future:
+        # queues the write and returns at once, a background thread commits queued writes in batches
+        if cls.write_behind is None:
+            cls.write_behind = WriteBehind()
+        return cls.write_behind.submit(cls, sql, params)
+
+    @classmethod
+    def _key(cls, method: str, sql: str, params: Optional[Iterable]) -> Optional[Hashable]:
+        # None when the read can't be shared, inside a transaction it may see uncommitted writes
+        if (cls.cache is None and not cls.single_flight) or cls._pinned() is not None:
+            return None
+        key = (cls, method, sql, tuple(json.dumps(p, default=str) if isinstance(p, (dict, list)) else p for p in params or ()))
         try:
-            with conn.cursor() as cursor:
-                cursor.execute(sql, *([params] if params else []))
-                results = cursor.fetchall()
-            cls._pool.free_connection(conn)
-            return results
-        except (pymysql.OperationalError, pypyodbc.InterfaceError, pymysql.InternalError) as e:
-            if isinstance(e, pymysql.InternalError) and 'Packet sequence' not in e.__repr__():
-                raise e
-            conn.close()
-            results = cls.fetchall(sql, params)
-            cls._pool.running.remove(conn)
-            cls._pool.connections.remove(conn)
-            return results
-        except pypyodbc.Error as e:
-            if 'Connection is busy' not in repr(e) and 'Invalid cursor state' not in repr(e):
-                raise e
-            results = cls.fetchall(sql, params)
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    @classmethod
+    def _flight(cls, key: Optional[Hashable]) -> Tuple[Optional[_Flight], bool]:
+        # the read's flight and whether this caller runs it
+        if key is None or not cls.single_flight:
+            return None, True
+        with _flights_lock:
+            if key in _flights:
+                return _flights[key], False
+            flight = _flights[key] = _Flight(key)
+        return flight, True
+
+    @classmethod
+    def _read(cls, method: str, sql: str, params: Optional[Iterable], lane: Optional[str]):
+        sql = cls._sql(sql, params)
+        key = cls._key(method, sql, params)
+        generation = None
+        if key is not None and cls.cache is not None:
+            hit, result = cls.cache.get(key)
+            if hit:
+                return result
+            generation = cls.cache.generation(cls)  # a write landing while this reads keeps the result out of the cache
+        flight, leader = cls._flight(key)
+        if not leader:
+            return flight.wait()
+        try:
+            result = cls._run(cls._reader(sql, params, method), lane)[0]
+        except BaseException as e:
+            if flight is not None:
+                flight.finish(error=e)
+            raise
+        if flight is not None:
+            flight.finish(result)
+        if key is not None and cls.cache is not None:
+            cls.cache.put(key, result, cls._tables(sql), generation)
+        return result
+
+    @classmethod
+    def fetch(cls, sql: str, params: Optional[Iterable] = None, lane: Optional[str] = None) -> Dict[str, Any]:
+        return cls._read('fetchone', sql, params, lane) or {}
+
+    @classmethod
+    def fetchall(cls, sql: str, params: Optional[Iterable] = None, lane: Optional[str] = None) -> List[Dict[str, Any]]:
+        return cls._read('fetchall', sql, params, lane)
+
+    @classmethod
+    def _schema(cls) -> Dict[str, dict]:
+        return (getattr(cls, 'mapping', None) or SERVERS.get(cls.__name__.lower()) or ({},))[0]
+
+    @classmethod
+    def _tables(cls, sql: str) -> FrozenSet[str]:
+        # lower cased names of the tables a statement touches, matched against the mapped schema when there is one
+        databases = cls._schema()
+        if not databases:
+            return frozenset(re.sub(r'[`"\[\]\s]', '', re.match(_TABLE_NAME, name.strip()).group()).split('.')[-1].lower() for names in _TABLE_REFERENCE.findall(sql) for name in re.sub(_TABLE_HINT, '', names, flags=re.IGNORECASE).split(','))
+        if getattr(cls, '_known_tables', (None,))[0] is not databases:
+            cls._known_tables = (databases, {table for database in databases.values() for table in database if table != 'NAME'})
+        return frozenset(word for word in _WORD.findall(sql.lower()) if word in cls._known_tables[1])
+
+    @classmethod
+    def _invalidate(cls, sql: str):
+        if cls.cache is not None:
+            cls.cache.invalidate(cls, cls._tables(sql))
+            pinned = _transactions.get().get(cls._pool)
+            if pinned is not None:  # again once the outermost transaction ends
+                pinned[2].append((cls, sql))
+
+    @classmethod
+    def _table(cls, table: str) -> Optional[Dict[str, dict]]:
+        # columns of table in the map_dbs schema, table can be qualified with its database
+        databases = cls._schema()
+        parts = [part.strip('"`[]').lower() for part in table.split('.')]
+        for database in ([databases.get(parts[0], {})] if len(parts) > 1 else databases.values()):
+            if parts[-1] in database:
+                return {k: v for k, v in database[parts[-1]].items() if k != 'NAME'}
+        return None
+
+    @classmethod
+    def _columns(cls, table: str, keys: List[str], schema: Optional[Dict[str, dict]] = None) -> List[str]:
+        # checks keys against the mapped schema and returns them as the server spells them
+        schema = schema or cls._table(table)
+        if schema is None:
+            return keys
+        unknown = [c for c in keys if c.lower() not in schema]
+        if unknown:
+            raise ValueError(f'Unknown columns for {table}: {", ".join(unknown)}')
+        return [schema[c.lower()]['name'] for c in keys]
+
+    @classmethod
+    def _atomic(cls, work: Callable[[Any], Any]) -> Callable[[Any], Any]:
+        # wraps a _run action so everything it executes commits together
+        def action(cursor):
+            # pypyodbc and pyodbc cursors commit or roll back on exit, pymysql leaves it to the connection, an open transaction() does either
+            mysql = issubclass(cls, MYSQL) and cls._pinned() is None
+            if mysql:
+                cursor.connection.begin()
+            try:
+                result = work(cursor)
+            except BaseException:
+                if mysql:
+                    cursor.connection.rollback()
+                raise
+            if mysql:
+                cursor.connection.commit()
+            return result
+
+        return action
+
+    @classmethod
+    def insert_many(cls, table: str, rows: Iterable, columns: Optional[Iterable[str]] = None, lane: Optional[str] = None) -> int:
+        # multi row INSERTs chunked to the server's parameter, row and packet limits, all run in one transaction on one connection
+        rows, schema = list(rows), cls._table(table)
+        if not rows:
+            return 0
+        if columns is None:
+            if isinstance(rows[0], dict):
+                columns = list(rows[0])
+            elif schema is not None:
+                columns = [k for k, v in schema.items() if not v['auto_inc']]
+            else:
+                raise ValueError(f'insert_many into {table} needs columns, it is not in the mapped schema')
+        keys = list(columns)
+        columns = cls._columns(table, keys, schema)
+        width = len(columns)
+        if cls.max_params and width > cls.max_params:
+            raise ValueError(f'{width} columns is over the {cls.max_params} parameter limit')
+        values = [[json.dumps(v) if isinstance(v, dict) else v for v in ([row[k] for k in keys] if isinstance(row, dict) else row)] for row in rows]
+        if any(len(row) != width for row in values):
+            raise ValueError(f'Every row needs {width} values for {table}')
+        quote = '`{}`' if issubclass(cls, MYSQL) else '"{}"'
+        prefix = f'INSERT INTO {table} ({", ".join(quote.format(c) for c in columns)}) VALUES '
+        row_sql = '(' + ', '.join(['%s' if issubclass(cls, MYSQL) else '?'] * width) + ')'
+        per_statement = min(cls.max_params // width if cls.max_params else inf, cls.max_rows or inf)
+        chunks, chunk, size = [], [], len(prefix)
+        for row in values:
+            # rough size of the row once sent, strings may need escaping
+            row_size = len(row_sql) + 2 + sum(2 * len(v) + 2 if isinstance(v, (str, bytes)) else 24 for v in row)
+            if chunk and (len(chunk) >= per_statement or size + row_size > cls.max_packet):
+                chunks.append(chunk)
+                chunk, size = [], len(prefix)
+            chunk.append(row)
+            size += row_size
+        chunks.append(chunk)
+        statements = [(prefix + ', '.join([row_sql] * len(chunk)), [v for row in chunk for v in row]) for chunk in chunks]
+
+        retried = cls._run(cls._atomic(lambda cursor: [cursor.execute(sql, params) for sql, params in statements]), lane)[1]
+        cls._invalidate(prefix)
+        for sql, params in statements:
+            cls._hooks(sql, params, retried)
+        return len(values)
+
+    @classmethod
+    async def aexecute(cls, sql: str, params: Optional[Iterable] = None, lane: Optional[str] = None):
+        sql = cls._sql(sql, params)
+        retried = (await cls._arun(cls._writer(sql, params), lane))[1]
+        cls._invalidate(sql)
+        cls._hooks(sql, params, retried)
+
+    @classmethod
+    async def _aread(cls, method: str, sql: str, params: Optional[Iterable], lane: Optional[str]):
+        sql = cls._sql(sql, params)
+        key = cls._key(method, sql, params)
+        generation = None
+        if key is not None and cls.cache is not None:
+            hit, result = cls.cache.get(key)
+            if hit:
+                return result
+            generation = cls.cache.generation(cls)  # a write landing while this reads keeps the result out of the cache
+        flight, leader = cls._flight(key)
+        if not leader:
+            return await flight.await_result()
+        if flight is None:
+            result = (await cls._arun(cls._reader(sql, params, method), lane))[0]
+        else:
+            def land(done):
+                if done.cancelled():
+                    flight.finish(error=asyncio.CancelledError())
+                elif done.exception() is not None:
+                    flight.finish(error=done.exception())
+                else:
+                    flight.finish(done.result()[0])
+
+            # shielded so the waiting callers still get a result if this one is cancelled
+            task = asyncio.ensure_future(cls._arun(cls._reader(sql, params, method), lane))
+            task.add_done_callback(land)
+            result = (await asyncio.shield(task))[0]
+        if key is not None and cls.cache is not None:
+            cls.cache.put(key, result, cls._tables(sql), generation)
+        return result
+
+    @classmethod
+    async def afetch(cls, sql: str, params: Optional[Iterable] = None, lane: Optional[str] = None) -> Dict[str, Any]:
+        return await cls._aread('fetchone', sql, params, lane) or {}
+
+    @classmethod
+    async def afetchall(cls, sql: str, params: Optional[Iterable] = None, lane: Optional[str] = None) -> List[Dict[str, Any]]:
+        return await cls._aread('fetchall', sql, params, lane)
+
+    @classmethod
+    def _open_stream(cls, conn, sql: str, params: Optional[Iterable]):
+        # the default MySQL cursors buffer the whole result client side, SSDictCursor reads rows off the wire as they are fetched
+        cursor = conn.cursor(pymysql.cursors.SSDictCursor) if issubclass(cls, MYSQL) else conn.cursor()
+        cursor.execute(cls._sql(sql, params), *([params] if params else []))
+        return cursor
+
+    @classmethod
+    def _close_stream(cls, conn, cursor, error: Optional[BaseException] = None, pinned: bool = False):
+        if pinned:
+            return cursor is not None and cursor.close()
+        # an unbuffered cursor closed part way reads the rest of the result first, dropping the connection is cheaper
+        if isinstance(error, (pymysql.OperationalError, pypyodbc.InterfaceError, pymysql.InternalError)) or (error is not None and cursor is not None and issubclass(cls, MYSQL)):
+            return cls._pool.discard(conn)
+        try:
+            if cursor is not None:
+                cursor.close()
+        finally:
             cls._pool.free_connection(conn)
-            return results
+
+    @classmethod
+    def iterate(cls, sql: str, params: Optional[Iterable] = None, batch_size: int = 1000, lane: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        # rows are fetched batch_size at a time, the connection is held until the generator finishes or is closed
+        pinned = cls._pinned()
+        conn, cursor = pinned or cls._pool.get_connection(lane=lane), None
+        try:
+            cursor = cls._open_stream(conn, sql, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        except BaseException as e:
+            cls._close_stream(conn, cursor, e, pinned is not None)
+            raise
+        cls._close_stream(conn, cursor, None, pinned is not None)
+
+    @classmethod
+    async def aiterate(cls, sql: str, params: Optional[Iterable] = None, batch_size: int = 1000, lane: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        # same as iterate with every driver call on the pool's executor
+        loop = asyncio.get_event_loop()
+        pinned = cls._pinned()
+        conn, cursor = pinned or await cls._pool.aget_connection(lane=lane), None
+        try:
+            cursor = await loop.run_in_executor(cls._pool.executor, cls._open_stream, conn, sql, params)
+            while True:
+                rows = await loop.run_in_executor(cls._pool.executor, cursor.fetchmany, batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        except BaseException as e:
+            await loop.run_in_executor(cls._pool.executor, cls._close_stream, conn, cursor, e, pinned is not None)
+            raise
+        await loop.run_in_executor(cls._pool.executor, cls._close_stream, conn, cursor, None, pinned is not None)
 
     @classmethod
     def get_databases(cls) -> Dict[str, dict]:  # used for api mapping
         raise NotImplementedError
 
 
+_INFILE_ESCAPES = {ord('\\'): '\\\\', ord('\t'): '\\t', ord('\n'): '\\n', ord('\r'): '\\r', 0: '\\0'}
+
+
+def _infile_field(value) -> bytes:
+    if value is None:
+        return b'\\N'
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value).replace(b'\\', b'\\\\').replace(b'\t', b'\\t').replace(b'\n', b'\\n').replace(b'\r', b'\\r').replace(b'\0', b'\\0')
+    if isinstance(value, bool):
+        value = int(value)
+    elif isinstance(value, dict):
+        value = json.dumps(value)
+    return str(value).translate(_INFILE_ESCAPES).encode()
+
+
+def _write_infile(path: str, rows: Iterable, keys: List[str]):
+    # LOAD DATA's default format: tab separated, backslash escaped, \N for NULL
+    with open(path, 'wb') as f:
+        lines = []
+        for row in rows:
+            lines.append(b'\t'.join(_infile_field(v) for v in ([row[k] for k in keys] if isinstance(row, dict) else row)) + b'\n')
+            if len(lines) >= 1000:
+                f.write(b''.join(lines))
+                lines.clear()
+        f.write(b''.join(lines))
+
+
 class MYSQL(DBConnection):
+    @classmethod
+    def load_rows(cls, table: str, rows: Iterable, columns: Iterable[str], lane: Optional[str] = None) -> int:
+        # streams rows into LOAD DATA LOCAL INFILE through a fifo so they are never all in memory, the pool has to connect with local_infile=True
+        keys = list(columns)
+        sql = f"LOAD DATA LOCAL INFILE %s INTO TABLE {table} CHARACTER SET utf8mb4 FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' ({', '.join(f'`{c}`' for c in cls._columns(table, keys))})"
+        folder = mkdtemp(prefix='easyconnect')
+        path, errors, writer = os_path.join(folder, 'rows'), [], None
+
+        def feed():
+            try:
+                _write_infile(path, rows, keys)
+            except BrokenPipeError:  # the load stopped reading
+                pass
+            except BaseException as e:
+                errors.append(e)
+
+        def stop_writer():
+            # a writer still waiting for a reader is let through by opening the read end, it then stops on a broken pipe
+            while writer is not None and writer.is_alive():
+                close(os_open(path, O_RDONLY | O_NONBLOCK))
+                writer.join(.1)
+
+        try:
+            if mkfifo is None:  # no fifos on Windows, spool to disk instead
+                _write_infile(path, rows, keys)
+            else:
+                mkfifo(path)
+                writer = Thread(target=feed, daemon=True)
+                writer.start()
+            pinned = cls._pinned()
+            with cls.connection(lane) if pinned is None else nullcontext(pinned) as conn:
+                if pinned is None:
+                    conn.begin()
+                try:
+                    try:
+                        with conn.cursor() as cursor:
+                            count = cursor.execute(sql, (path,))
+                    finally:
+                        stop_writer()
+                    if errors:
+                        raise errors[0]
+                except BaseException:
+                    if pinned is None:
+                        conn.rollback()
+                    raise
+                if pinned is None:
+                    conn.commit()
+        finally:
+            stop_writer()  # also when the checkout or begin failed before the load could read
+            rmtree(folder, ignore_errors=True)
+        cls._invalidate(sql)
+        cls._hooks(sql, (path,), False)
+        return count
+
     @classmethod
     def get_databases(cls) -> Dict[str, dict]:
         databases = {}
@@ -200,6 +1149,8 @@ class MYSQL(DBConnection):
 
 
 class MSSQL(DBConnection):
+    max_params = 2099  # the server allows 2100, drivers that wrap statements in sp_executesql use one of them
+    max_rows = 1000  # most rows a VALUES list accepts
     _driver = 'FreeTDS' if system() == 'Linux' else ([_ for _ in pypyodbc.drivers() if 'SQL Server' in _] or ['SQL Server'])[0]
 
     @classmethod
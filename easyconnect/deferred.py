@@ -0,0 +1,109 @@
+import atexit
+import json
+from concurrent.futures import Future
+from os import getpid
+from queue import Empty, Queue
+from threading import Lock, Thread
+from time import monotonic
+from typing import Iterable, Optional
+
+
+class WriteBehind:
+    def __init__(self, max_queue: int = 10000, batch_size: int = 500, flush_interval: float = .05, put_timeout: Optional[float] = None, lane: Optional[str] = None):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval  # how long a batch waits to fill after its first write
+        self.put_timeout = put_timeout  # how long submit blocks on a full queue before raising queue.Full, None waits
+        self.lane = lane
+        self.thread = None
+        self.pid = getpid()
+        self.queue = Queue(max_queue)
+        self.__lock = Lock()
+
+    def submit(self, db, sql: str, params: Optional[Iterable] = None) -> Future:
+        if self.pid != getpid():  # the parent flushes what it queued before forking
+            self.pid, self.thread, self.queue = getpid(), None, Queue(self.max_queue)
+        if self.thread is None or not self.thread.is_alive():
+            with self.__lock:
+                if self.thread is None or not self.thread.is_alive():
+                    if self.thread is None:
+                        atexit.register(self.close)
+                    self.thread = Thread(target=self._flusher, daemon=True, name='easyconnect-write-behind')
+                    self.thread.start()
+        future = Future()
+        self.queue.put((db, db._sql(sql, params), params, future), timeout=self.put_timeout)
+        return future
+
+    def _flusher(self):
+        stop = False
+        while not stop:
+            batch = [self.queue.get()]
+            deadline = monotonic() + self.flush_interval
+            while batch[-1] is not None and len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get(timeout=max(0, deadline - monotonic())))
+                except Empty:
+                    break
+            if batch[-1] is None:
+                stop = True
+                batch.pop()
+            groups = {}
+            for db, sql, params, future in batch:
+                runs = groups.setdefault(db, [])
+                if not runs or runs[-1][0] != sql:  # only back to back writes of the same sql share an executemany
+                    runs.append((sql, []))
+                runs[-1][1].append((params, future))
+            for db, runs in groups.items():
+                try:
+                    self._write(db, runs)
+                except Exception as e:  # the flusher must outlive any batch, later writes are still queued behind it
+                    print(f'[POOL] {db.__name__} deferred write failed: {e!r}')
+            for _ in range(len(batch) + stop):
+                self.queue.task_done()
+
+    def _write(self, db, runs: list):
+        # one transaction per class, runs of consecutive writes sharing their sql go through executemany, submission order is kept
+        # writes whose future was cancelled are dropped, the rest can't be cancelled any more so resolving them can't raise
+        live = []
+        for sql, writes in runs:
+            writes = [(params, future) for params, future in writes if future.set_running_or_notify_cancel()]
+            if writes:
+                live.append((sql, writes))
+        if not live:
+            return
+        runs = live
+
+        def work(cursor):
+            for sql, writes in runs:
+                if all(params for params, _ in writes):
+                    cursor.executemany(sql, [[json.dumps(p) if isinstance(p, dict) else p for p in params] for params, _ in writes])
+                else:
+                    for params, _ in writes:
+                        cursor.execute(sql, *([[json.dumps(p) if isinstance(p, dict) else p for p in params]] if params else []))
+
+        futures = [future for _, writes in runs for _, future in writes]
+        try:
+            retried = db._run(db._atomic(work), self.lane)[1]
+        except BaseException as e:
+            print(f'[POOL] {db.__name__} deferred write of {len(futures)} statements failed: {e!r}')
+            [future.set_exception(e) for future in futures]
+            return
+        [future.set_result(None) for future in futures]
+        for sql, writes in runs:
+            db._invalidate(sql)
+            for params, _ in writes:
+                try:
+                    db._hooks(sql, params, retried)
+                except Exception as e:  # nobody is waiting to see it, don't let it stop the flusher
+                    print(f'[POOL] {db.__name__} hook failed after deferred write: {e!r}')
+
+    def flush(self):
+        # blocks until everything queued so far is written
+        if self.thread is not None:
+            self.queue.join()
+
+    def close(self):
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.thread = None
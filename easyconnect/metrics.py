@@ -0,0 +1,135 @@
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Lock, Thread
+from typing import Iterable, Optional
+
+from easyconnect.cache import COUNTERS as CACHE_COUNTERS
+
+COUNTERS = {
+    'created': 'Connections opened by the pool.',
+    'destroyed': 'Connections closed by the pool.',
+    'reconnects': 'Queries moved to a new connection after a connection error.',
+    'retries': 'Queries retried by DBConnection.execute/fetch/fetchall.',
+    'exhausted': 'Checkouts that timed out waiting for a connection.',
+    'leaks': 'Connections held past the leak threshold.',
+}
+
+
+class Histogram:
+    def __init__(self, buckets: Iterable[float] = (.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.__lock = Lock()
+
+    def observe(self, value: float):
+        i = bisect_left(self.buckets, value)
+        with self.__lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def snapshot(self) -> dict:
+        with self.__lock:
+            counts, total = list(self.counts), self.sum
+        cumulative, buckets = 0, {}
+        for le, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            buckets[le] = cumulative
+        return {'buckets': buckets, 'sum': total, 'count': cumulative}
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.checkout_wait = Histogram()
+        self.hold_time = Histogram()  # checkout to return, mostly query time on the server
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.__lock = Lock()
+
+    def incr(self, *names: str):
+        with self.__lock:
+            for name in names:
+                self.counters[name] += 1
+
+    def snapshot(self) -> dict:
+        with self.__lock:
+            stats = dict(self.counters)
+        stats['checkout_wait'] = self.checkout_wait.snapshot()
+        stats['hold_time'] = self.hold_time.snapshot()
+        return stats
+
+
+def _classes(servers: Optional[dict]) -> dict:
+    # accepts SERVERS style values (databases, class) as well as plain classes or pools
+    if servers is None:
+        from easyconnect.db_pool import SERVERS
+        servers = SERVERS
+    return {name: value[1] if isinstance(value, tuple) else value for name, value in servers.items()}
+
+
+def _pools(servers: Optional[dict]) -> dict:
+    return {name: getattr(value, '_pool', value) for name, value in _classes(servers).items()}
+
+
+def _fmt(value) -> str:
+    return '+Inf' if value == float('inf') else repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(servers: Optional[dict] = None) -> str:
+    stats = {name: pool.stats() for name, pool in _pools(servers).items()}
+    caches = {name: value.cache.stats() for name, value in _classes(servers).items() if getattr(value, 'cache', None) is not None}
+    lines = ['# HELP easyconnect_pool_connections Pooled connections by state.', '# TYPE easyconnect_pool_connections gauge']
+    for name, s in stats.items():
+        lines.extend(f'easyconnect_pool_connections{{pool="{name}",state="{state}"}} {s[state]}' for state in ('in_use', 'idle', 'total', 'waiting', 'leaked'))
+    lines.extend(('# HELP easyconnect_pool_max_size Configured pool size limit, 0 when unbounded.', '# TYPE easyconnect_pool_max_size gauge'))
+    lines.extend(f'easyconnect_pool_max_size{{pool="{name}"}} {s["max_size"]}' for name, s in stats.items())
+    for counter, description in COUNTERS.items():
+        lines.extend((f'# HELP easyconnect_pool_{counter}_total {description}', f'# TYPE easyconnect_pool_{counter}_total counter'))
+        lines.extend(f'easyconnect_pool_{counter}_total{{pool="{name}"}} {s[counter]}' for name, s in stats.items())
+    for histogram, description in (('checkout_wait', 'Time spent waiting for a pooled connection.'), ('hold_time', 'Time a connection stays checked out.')):
+        metric = f'easyconnect_pool_{histogram}_seconds'
+        lines.extend((f'# HELP {metric} {description}', f'# TYPE {metric} histogram'))
+        for name, s in stats.items():
+            h = s[histogram]
+            lines.extend(f'{metric}_bucket{{pool="{name}",le="{_fmt(le)}"}} {count}' for le, count in h['buckets'].items())
+            lines.append(f'{metric}_sum{{pool="{name}"}} {_fmt(h["sum"])}')
+            lines.append(f'{metric}_count{{pool="{name}"}} {h["count"]}')
+    if caches:
+        for counter, description in CACHE_COUNTERS.items():
+            lines.extend((f'# HELP easyconnect_cache_{counter}_total {description}', f'# TYPE easyconnect_cache_{counter}_total counter'))
+            lines.extend(f'easyconnect_cache_{counter}_total{{pool="{name}"}} {s[counter]}' for name, s in caches.items())
+        for gauge, description in (('entries', 'Results held by the query cache.'), ('bytes', 'Approximate size of the cached results.')):
+            lines.extend((f'# HELP easyconnect_cache_{gauge} {description}', f'# TYPE easyconnect_cache_{gauge} gauge'))
+            lines.extend(f'easyconnect_cache_{gauge}{{pool="{name}"}} {s[gauge]}' for name, s in caches.items())
+    return '\n'.join(lines) + '\n'
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def serve_metrics(port: int = 9150, host: str = '127.0.0.1', servers: Optional[dict] = None) -> HTTPServer:
+    # GET /metrics renders every pool, /metrics/<name> a single SERVERS entry
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.rstrip('/').split('/')
+            if path[1:2] != ['metrics'] or len(path) > 3:
+                return self.send_error(404)
+            pools = servers
+            if len(path) == 3:
+                pools = {k: v for k, v in _classes(servers).items() if k == path[2]}  # the class, so its cache is rendered too
+                if not pools:
+                    return self.send_error(404)
+            body = render_prometheus(pools).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = _ThreadingHTTPServer((host, port), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -1,13 +1,27 @@
 import ctypes
 import os
+import struct
 import sys
 import threading
+from collections import OrderedDict, deque
 from _datetime import date, datetime, time
 from decimal import Decimal
 from typing import Iterable, Optional
 
 POOLING = True
 CONNECTION_TIMEOUT = 0
+# Serialize SQLDriverConnect on unixODBC, see Connection.connect. Set to False when the driver manager is known to be thread safe so pooled connections can be opened in parallel.
+SERIALIZE_CONNECT = True
+# Prepared statements each connection keeps by sql text, so alternating parameterized queries aren't prepared and bound again, 0 disables the cache
+STATEMENT_CACHE_SIZE = 32
+# Idle statement handles each connection keeps for its next cursors instead of freeing and allocating one per cursor
+STATEMENT_HANDLE_POOL_SIZE = 8
+# Rows executemany binds as parameter arrays and sends in one SQLExecute, 0 executes row by row
+PARAM_ARRAY_SIZE = 1000
+# Rows fetchmany/fetchall bind as column arrays and get per SQLFetchScroll, 0 fetches row by row
+ROW_ARRAY_SIZE = 256
+# Fetch and bind integers, floats, bits, dates, timestamps and numerics as C values instead of text, types with an added output converter still get text
+NATIVE_TYPES = True
 if not hasattr(ctypes, 'c_ssize_t'):
     if ctypes.sizeof(ctypes.c_uint) == ctypes.sizeof(ctypes.c_void_p):
         ctypes.c_ssize_t = ctypes.c_int
@@ -32,6 +46,13 @@ SQL_NULL_DATA = -1
 SQL_RESET_PARAMS = 3
 SQL_UNBIND = 2
 SQL_CLOSE = 0
+SQL_ATTR_PARAM_STATUS_PTR, SQL_ATTR_PARAMS_PROCESSED_PTR, SQL_ATTR_PARAMSET_SIZE = 20, 21, 22
+SQL_PARAM_DIAG_UNAVAILABLE, SQL_PARAM_ERROR = 1, 5
+SQL_ATTR_ROW_STATUS_PTR, SQL_ATTR_ROWS_FETCHED_PTR, SQL_ATTR_ROW_ARRAY_SIZE = 25, 26, 27
+SQL_FETCH_NEXT = 1
+SQL_ROW_NOROW, SQL_ROW_ERROR = 3, 5
+SQL_ATTR_APP_ROW_DESC, SQL_ATTR_APP_PARAM_DESC = 10010, 10011
+SQL_DESC_TYPE, SQL_DESC_PRECISION, SQL_DESC_SCALE, SQL_DESC_DATA_PTR = 1002, 1005, 1006, 1010
 # Below defines The constants for sqlgetinfo method, and their coresponding return types
 SQL_ACCESSIBLE_PROCEDURES = 20
 SQL_ACCESSIBLE_TABLES = 19
@@ -381,6 +402,7 @@ SQL_LONGVARCHAR = -1
 SQL_VARBINARY = -3
 SQL_LONGVARBINARY = -4
 SQL_BIGINT = -5
+SQL_C_SBIGINT = -25
 SQL_WVARCHAR = -9
 SQL_WLONGVARCHAR = -10
 SQL_SS_VARIANT = -150
@@ -388,19 +410,19 @@ SQL_SS_UDT = -151
 SQL_SS_XML = -152
 SQL_SS_TIME2 = -154
 SQL_C_CHAR = SQL_CHAR = 1
-SQL_NUMERIC = 2
+SQL_C_NUMERIC = SQL_NUMERIC = 2
 SQL_INTEGER = 4
 SQL_SMALLINT = 5
 SQL_REAL = 7
-SQL_DOUBLE = 8
-SQL_TYPE_DATE = 91
+SQL_C_DOUBLE = SQL_DOUBLE = 8
+SQL_C_TYPE_DATE = SQL_TYPE_DATE = 91
 SQL_TYPE_TIME = 92
 SQL_C_BINARY = SQL_BINARY = -2
 SQL_TINYINT = -6
-SQL_BIT = -7
+SQL_C_BIT = SQL_BIT = -7
 SQL_C_WCHAR = SQL_WCHAR = -8
 SQL_GUID = -11
-SQL_TYPE_TIMESTAMP = 93
+SQL_C_TYPE_TIMESTAMP = SQL_TYPE_TIMESTAMP = 93
 
 
 def dttm_cvt(x) -> Optional[datetime]:
@@ -428,6 +450,58 @@ def decimal_cvt(x) -> Decimal:
     return Decimal(x.decode('ascii'))
 
 
+# Layouts of the C types columns are fetched and parameters bound as with native types, SQL_DATE_STRUCT, SQL_TIMESTAMP_STRUCT and SQL_NUMERIC_STRUCT in sqltypes.h
+SBIGINT, DOUBLE, BIT, DATE_STRUCT, TIMESTAMP_STRUCT, NUMERIC_STRUCT = struct.Struct('q'), struct.Struct('d'), struct.Struct('?'), struct.Struct('hHH'), struct.Struct('hHHHHHI'), struct.Struct('BbB16s')
+
+
+def sbigint_cvt(x) -> int:
+    return SBIGINT.unpack(x)[0]
+
+
+def double_cvt(x) -> float:
+    return DOUBLE.unpack(x)[0]
+
+
+def bit_cvt(x) -> bool:
+    return x[0] != 0
+
+
+def date_struct_cvt(x) -> date:
+    return date(*DATE_STRUCT.unpack(x))
+
+
+def timestamp_struct_cvt(x) -> datetime:
+    year, month, day, hour, minute, second, fraction = TIMESTAMP_STRUCT.unpack(x)
+    return datetime(year, month, day, hour, minute, second, fraction // 1000)
+
+
+def numeric_struct_cvt(x) -> Decimal:
+    precision, scale, sign, val = NUMERIC_STRUCT.unpack(x)
+    value = int.from_bytes(val, 'little')
+    # built from its digits, scaleb would round past the context's 28 digits
+    return Decimal((0 if sign or not value else 1, tuple(map(int, str(value))), -scale))
+
+
+def pack_native(buffer, offset, value, c_type, precision=0, scale=0):
+    # writes value into buffer at offset as the C type it is bound with
+    if c_type == SQL_C_SBIGINT:
+        SBIGINT.pack_into(buffer, offset, value)
+    elif c_type == SQL_C_DOUBLE:
+        DOUBLE.pack_into(buffer, offset, value)
+    elif c_type == SQL_C_BIT:
+        BIT.pack_into(buffer, offset, value)
+    elif c_type == SQL_C_TYPE_DATE:
+        DATE_STRUCT.pack_into(buffer, offset, value.year, value.month, value.day)
+    elif c_type == SQL_C_TYPE_TIMESTAMP:
+        # drivers refuse fractions finer than the bound scale
+        fraction = value.microsecond * 1000
+        TIMESTAMP_STRUCT.pack_into(buffer, offset, value.year, value.month, value.day, value.hour, value.minute, value.second, fraction - fraction % 10 ** max(9 - scale, 0))
+    elif c_type == SQL_C_NUMERIC:
+        sign, digits, exponent = value.as_tuple()
+        val = int(''.join(map(str, digits))) * 10 ** (exponent + scale)
+        NUMERIC_STRUCT.pack_into(buffer, offset, precision, scale, 0 if sign else 1, val.to_bytes(16, 'little'))
+
+
 bytearray_cvt = bytearray
 if sys.platform == 'cli':
     def bytearray_cvt(x):
@@ -468,6 +542,33 @@ SQL_DATA_TYPE_DICT = {
     SQL_SS_XML: (str, lambda x: x, SQL_C_WCHAR, CREATE_BUFFER_U, 20500, True),
     SQL_SS_UDT: (bytearray, bytearray_cvt, SQL_C_BINARY, CREATE_BUFFER, 5120, True),
 }
+SQL_NATIVE_TYPE_DICT = {
+    # SQL Data TYPE        0.Buffer Type     1.Output Converter     2.Buffer Size
+    SQL_TINYINT: (SQL_C_SBIGINT, sbigint_cvt, SBIGINT.size),
+    SQL_SMALLINT: (SQL_C_SBIGINT, sbigint_cvt, SBIGINT.size),
+    SQL_INTEGER: (SQL_C_SBIGINT, sbigint_cvt, SBIGINT.size),
+    SQL_BIGINT: (SQL_C_SBIGINT, sbigint_cvt, SBIGINT.size),
+    SQL_FLOAT: (SQL_C_DOUBLE, double_cvt, DOUBLE.size),
+    SQL_DOUBLE: (SQL_C_DOUBLE, double_cvt, DOUBLE.size),
+    SQL_BIT: (SQL_C_BIT, bit_cvt, 1),
+    SQL_DATE: (SQL_C_TYPE_DATE, date_struct_cvt, DATE_STRUCT.size),
+    SQL_TYPE_DATE: (SQL_C_TYPE_DATE, date_struct_cvt, DATE_STRUCT.size),
+    SQL_TIMESTAMP: (SQL_C_TYPE_TIMESTAMP, timestamp_struct_cvt, TIMESTAMP_STRUCT.size),
+    SQL_TYPE_TIMESTAMP: (SQL_C_TYPE_TIMESTAMP, timestamp_struct_cvt, TIMESTAMP_STRUCT.size),
+    SQL_NUMERIC: (SQL_C_NUMERIC, numeric_struct_cvt, NUMERIC_STRUCT.size),
+    SQL_DECIMAL: (SQL_C_NUMERIC, numeric_struct_cvt, NUMERIC_STRUCT.size),
+}
+NATIVE_C_TYPES = {profile[0] for profile in SQL_NATIVE_TYPE_DICT.values()}
+# get_type codes bound as C values, times stay text since SQL_TIME_STRUCT has no fraction
+NATIVE_PARAM_TYPES = {
+    'i': (SQL_C_SBIGINT, SBIGINT.size),
+    'l': (SQL_C_SBIGINT, SBIGINT.size),
+    'f': (SQL_C_DOUBLE, DOUBLE.size),
+    'b': (SQL_C_BIT, BIT.size),
+    'd': (SQL_C_TYPE_DATE, DATE_STRUCT.size),
+    'dt': (SQL_C_TYPE_TIMESTAMP, TIMESTAMP_STRUCT.size),
+    'D': (SQL_C_NUMERIC, NUMERIC_STRUCT.size),
+}
 """
 Types mapping, applicable for 32-bit and 64-bit Linux / Windows / Mac OS X.
 SQLPointer -> ctypes.c_void_p
@@ -481,7 +582,7 @@ SQLULEN -> ctypes.c_size_t
 SQLRETURN -> ctypes.c_short
 """
 # Define the python return type for ODBC functions with ret result.
-for func_name in ("SQLAllocHandle", "SQLBindParameter", "SQLBindCol", "SQLCloseCursor", "SQLColAttribute", "SQLColumns", "SQLColumnsW", "SQLConnect", "SQLConnectW", "SQLDataSources", "SQLDataSourcesW", "SQLDescribeCol", "SQLDescribeColW", "SQLDescribeParam", "SQLDisconnect", "SQLDriverConnect", "SQLDriverConnectW", "SQLDrivers", "SQLDriversW", "SQLEndTran", "SQLExecDirect", "SQLExecDirectW", "SQLExecute", "SQLFetch", "SQLFetchScroll", "SQLForeignKeys", "SQLForeignKeysW", "SQLFreeHandle", "SQLFreeStmt", "SQLGetData", "SQLGetDiagRec", "SQLGetDiagRecW", "SQLGetInfo", "SQLGetInfoW", "SQLGetTypeInfo", "SQLMoreResults", "SQLNumParams", "SQLNumResultCols", "SQLPrepare", "SQLPrepareW", "SQLPrimaryKeys", "SQLPrimaryKeysW", "SQLProcedureColumns", "SQLProcedureColumnsW", "SQLProcedures", "SQLProceduresW", "SQLRowCount", "SQLSetConnectAttr", "SQLSetEnvAttr", "SQLStatistics", "SQLStatisticsW", "SQLTables", "SQLTablesW"):
+for func_name in ("SQLAllocHandle", "SQLBindParameter", "SQLBindCol", "SQLCloseCursor", "SQLColAttribute", "SQLColumns", "SQLColumnsW", "SQLConnect", "SQLConnectW", "SQLDataSources", "SQLDataSourcesW", "SQLDescribeCol", "SQLDescribeColW", "SQLDescribeParam", "SQLDisconnect", "SQLDriverConnect", "SQLDriverConnectW", "SQLDrivers", "SQLDriversW", "SQLEndTran", "SQLExecDirect", "SQLExecDirectW", "SQLExecute", "SQLFetch", "SQLFetchScroll", "SQLForeignKeys", "SQLForeignKeysW", "SQLFreeHandle", "SQLFreeStmt", "SQLGetData", "SQLGetDiagRec", "SQLGetDiagRecW", "SQLGetInfo", "SQLGetInfoW", "SQLGetTypeInfo", "SQLMoreResults", "SQLNumParams", "SQLNumResultCols", "SQLPrepare", "SQLPrepareW", "SQLPrimaryKeys", "SQLPrimaryKeysW", "SQLProcedureColumns", "SQLProcedureColumnsW", "SQLProcedures", "SQLProceduresW", "SQLRowCount", "SQLGetStmtAttr", "SQLSetConnectAttr", "SQLSetDescField", "SQLSetEnvAttr", "SQLSetStmtAttr", "SQLStatistics", "SQLStatisticsW", "SQLTables", "SQLTablesW"):
     getattr(ODBC_API, func_name).restype = ctypes.c_short
 if sys.platform not in 'cli':
     # Seems like the IronPython can not declare ctypes.POINTER type arguments
@@ -517,8 +618,11 @@ ODBC_API.SQLPrepare.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int]
 ODBC_API.SQLPrimaryKeys.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_short, ctypes.c_char_p, ctypes.c_short, ctypes.c_char_p, ctypes.c_short]
 ODBC_API.SQLProcedureColumns.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_short, ctypes.c_char_p, ctypes.c_short, ctypes.c_char_p, ctypes.c_short, ctypes.c_char_p, ctypes.c_short]
 ODBC_API.SQLProcedures.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_short, ctypes.c_char_p, ctypes.c_short, ctypes.c_char_p, ctypes.c_short]
+ODBC_API.SQLGetStmtAttr.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p]
 ODBC_API.SQLSetConnectAttr.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+ODBC_API.SQLSetDescField.argtypes = [ctypes.c_void_p, ctypes.c_short, ctypes.c_short, ctypes.c_void_p, ctypes.c_int]
 ODBC_API.SQLSetEnvAttr.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+ODBC_API.SQLSetStmtAttr.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
 ODBC_API.SQLStatistics.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_short, ctypes.c_char_p, ctypes.c_short, ctypes.c_char_p, ctypes.c_short, ctypes.c_ushort, ctypes.c_ushort]
 ODBC_API.SQLTables.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_short, ctypes.c_char_p, ctypes.c_short, ctypes.c_char_p, ctypes.c_short, ctypes.c_char_p, ctypes.c_short]
 
@@ -681,12 +785,49 @@ def get_type(v):
     return type(v)
 
 
+# get_array_type picks the one type a column of parameter arrays is bound with, None when the rows' types can't share a binding
+def get_array_type(param_types):
+    kinds = {t[0] for t in param_types} - {'N', 'BN'}
+    sizes = [t[1] for t in param_types if t[0] in {'U', 'S', 'bi'}]
+    if not kinds:
+        return ('BN',) if ('BN',) in param_types else ('N',)
+    elif kinds <= {'u', 'U'}:
+        return ('U', max(sizes)) if sizes else ('u',)
+    elif kinds <= {'s', 'S'}:
+        return ('S', max(sizes)) if sizes else ('s',)
+    elif kinds <= {'i', 'l'}:
+        return 'l' in kinds and ('l',) or ('i',)
+    elif kinds == {'i', 'f'}:
+        return 'f',
+    elif kinds == {'D'}:
+        # enough digits on both sides of the point for every row
+        scale = max(max(t[1][1], 0) for t in param_types if t[0] == 'D')
+        return 'D', (max([0] + [t[1][0] - t[1][1] for t in param_types if t[0] == 'D']) + scale, scale)
+    elif kinds == {'bi'}:
+        return 'bi', max(sizes)
+    elif len(kinds) == 1 and kinds <= {'b', 'f', 'dt', 'd', 't'}:
+        return kinds.pop(),
+    return None
+
+
 # The Cursor Class.
+class PreparedStatement:
+    # a prepared statement handle with its bound parameter buffers, kept in Connection.statements between executes
+    def __init__(self, stmt_h, statement, param_sql_type_list):
+        self.stmt_h = stmt_h
+        self.statement = statement
+        self.param_sql_type_list = param_sql_type_list
+        self.last_param_types = None
+        self.param_buffer_list = []
+        self.in_use = False
+
+
 class Cursor:
     def __init__(self, conx, row_type_callable=None):
         """ Initialize self.stmt_h, which is the handle of a statement
         A statement is actually the basis of a python "cursor" object"""
-        self.stmt_h = ctypes.c_void_p()
+        self.stmt_h = None
+        self._prepared = None
         self.connection = conx
         self.ansi = conx.ansi
         self.row_type_callable = row_type_callable or dict_row
@@ -700,12 +841,22 @@ class Cursor:
         self._col_type_code_list = []
         self._outputsize = {}
         self._inputsizers = []
-        check_success(self, ODBC_API.SQLAllocHandle(SQL_HANDLE_STMT, self.connection.dbc_h, ADDR(self.stmt_h)))
+        self._block = None  # (columns, row status, rows fetched) while the result set is bound as arrays
+        self._pending = deque()  # rows of the last rowset not handed out yet
+        self.closed = True  # until a handle is held, so a failed allocation isn't freed by __del__
+        if conx.handles:
+            # handles are reset before they go back to the connection, only the timeout may differ
+            self.stmt_h, timeout = conx.handles.pop()
+        else:
+            self.stmt_h, timeout = ctypes.c_void_p(), 0
+            check_success(self, ODBC_API.SQLAllocHandle(SQL_HANDLE_STMT, self.connection.dbc_h, ADDR(self.stmt_h)))
+        self._own_stmt_h = self.stmt_h
+        self._clean = True  # nothing has run on the own handle yet, so it needs no reset
+        self.closed = False
         self.timeout = conx.timeout
-        if self.timeout != 0:
+        if self.timeout != timeout:
             self.set_timeout(self.timeout)
         self._param_sql_type_list = []
-        self.closed = False
 
     def set_timeout(self, timeout):
         self.timeout = timeout
@@ -724,6 +875,8 @@ class Cursor:
             ret = ODBC_API.SQLPrepare(self.stmt_h, c_query_string, len(query_string))
         if ret != SQL_SUCCESS:
             check_success(self, ret)
+        if self.stmt_h is self._own_stmt_h:
+            self._clean = False
         self._param_sql_type_list = []
         if self.connection.support_SQLDescribeParam:
             num_params = C_SHORT()
@@ -764,9 +917,38 @@ class Cursor:
             raise ProgrammingError('HY000', f'The SQL contains {num_params.value} parameter markers, but {len(param_types)} parameters were supplied')
         # Every parameter needs to be binded to a buffer
         param_buffer_list = []
+        for col_num, (sql_c_type, sql_type, buf_size, dec_num, parameter_buffer) in enumerate(self._param_bindings(param_types)):
+            len_or_ind_buf = C_SSIZE_T()
+            input_output_type = 1
+            if len(pram_io_list) > col_num:
+                input_output_type = pram_io_list[col_num]
+            self._bind_param(col_num, input_output_type, sql_c_type, sql_type, buf_size, dec_num, parameter_buffer, len(parameter_buffer) if sql_c_type in NATIVE_C_TYPES else buf_size, ADDR(len_or_ind_buf))
+            # Append the value buffer and the length buffer to the array, C values are packed with the precision and scale they are bound with
+            param_buffer_list.append((parameter_buffer, len_or_ind_buf, sql_type, sql_c_type, buf_size, dec_num))
+        self._last_param_types = param_types
+        self._param_buffer_list = param_buffer_list
+
+    def _bind_param(self, col_num, io_type, sql_c_type, sql_type, buf_size, dec_num, buffer, buf_len, len_or_ind_buf):
+        """SQLBindParameter, numerics also get their precision and scale through the parameter descriptor"""
+        ret = ODBC_API.SQLBindParameter(self.stmt_h, col_num + 1, io_type, sql_c_type, sql_type, buf_size, dec_num, ADDR(buffer), C_SSIZE_T(buf_len), len_or_ind_buf)
+        if ret != SQL_SUCCESS:
+            check_success(self, ret)
+        if sql_c_type == SQL_C_NUMERIC:
+            self._set_numeric_desc(SQL_ATTR_APP_PARAM_DESC, col_num, buf_size, dec_num, buffer)
+
+    def _set_numeric_desc(self, desc_attr, col_num, precision, scale, buffer):
+        """Set the type, precision and scale of a SQL_C_NUMERIC record of the row or parameter descriptor"""
+        desc_h = ctypes.c_void_p()
+        check_success(self, ODBC_API.SQLGetStmtAttr(self.stmt_h, desc_attr, ADDR(desc_h), 0, None))
+        # setting the type, precision or scale unbinds the record, the data pointer goes last
+        for field, value in ((SQL_DESC_TYPE, SQL_C_NUMERIC), (SQL_DESC_PRECISION, precision), (SQL_DESC_SCALE, scale), (SQL_DESC_DATA_PTR, ctypes.addressof(buffer))):
+            check_success(self, ODBC_API.SQLSetDescField(desc_h, col_num + 1, field, value, 0))
+
+    def _param_bindings(self, param_types):
+        """(c type, sql type, column size, decimal digits, buffer) to bind each of param_types with"""
         # Temporary holder since we can only call SQLDescribeParam before calling SQLBindParam.
         temp_holder = []
-        for col_num in range(num_params.value):
+        for col_num in range(len(param_types)):
             dec_num = 0
             sql_c_type = SQL_C_CHAR
             param_types_0 = param_types[col_num][0]
@@ -864,21 +1046,14 @@ class Cursor:
             else:
                 sql_type = SQL_LONGVARCHAR
                 buf_size = len(self._inputsizers) > col_num and self._inputsizers[col_num] or 20500
+            if self.connection.native_types and param_types_0 in NATIVE_PARAM_TYPES and (param_types_0 != 'D' or buf_size <= 38):
+                # numerics past 38 digits don't fit SQL_NUMERIC_STRUCT and stay text
+                sql_c_type, native_size = NATIVE_PARAM_TYPES[param_types_0]
+                parameter_buffer = CREATE_BUFFER(native_size)
             parameter_buffer = locals().get('parameter_buffer', CREATE_BUFFER(buf_size))
             temp_holder.append((sql_c_type, sql_type, buf_size, dec_num, parameter_buffer))
             del parameter_buffer
-        for col_num, (sql_c_type, sql_type, buf_size, dec_num, parameter_buffer) in enumerate(temp_holder):
-            len_or_ind_buf = C_SSIZE_T()
-            input_output_type = 1
-            if len(pram_io_list) > col_num:
-                input_output_type = pram_io_list[col_num]
-            ret = ODBC_API.SQLBindParameter(self.stmt_h, col_num + 1, input_output_type, sql_c_type, sql_type, buf_size, dec_num, ADDR(parameter_buffer), C_SSIZE_T(buf_size), ADDR(len_or_ind_buf))
-            if ret != SQL_SUCCESS:
-                check_success(self, ret)
-            # Append the value buffer and the length buffer to the array
-            param_buffer_list.append((parameter_buffer, len_or_ind_buf, sql_type))
-        self._last_param_types = param_types
-        self._param_buffer_list = param_buffer_list
+        return temp_holder
 
     def execute(self, query_string, params=None, many_mode=False):
         """Execute the query string, with optional parameters.
@@ -886,82 +1061,35 @@ class Cursor:
         If parameters are not provided, only th query sting, it would be executed directly"""
         if not self.connection:
             self.close()
-        self._free_stmt(SQL_CLOSE)
         if params:
             # If parameters exist, first prepare the query then executed with parameters
             if not isinstance(params, (tuple, list)):
                 raise TypeError("Params must be in a list, tuple")
             if query_string != self.statement:
                 # if the query is not same as last query, then it is not prepared
-                self.prepare(query_string)
+                self._use_prepared(query_string)
+            else:
+                self._free_stmt(SQL_CLOSE)
             param_types = [get_type(_) for _ in params]
             if self._last_param_types is None or len(param_types) != len(self._last_param_types) or any(p_type[0] != 'N' and p_type != self._last_param_types[i] for i, p_type in enumerate(param_types)):
                 self._free_stmt(SQL_RESET_PARAMS)
                 self._bind_params(param_types)
             # With query prepared, now put parameters into buffers
             col_num = 0
-            for param_buffer, param_buffer_len, sql_type in self._param_buffer_list:
-                c_char_buf, c_buf_len = '', 0
+            for param_buffer, param_buffer_len, sql_type, sql_c_type, buf_size, dec_num in self._param_buffer_list:
                 param_val = params[col_num]
                 param_types_0 = param_types[col_num][0]
                 if param_types_0 in {'N', 'BN'}:
                     param_buffer_len.value = SQL_NULL_DATA
                     col_num += 1
                     continue
-                elif param_types_0 in {'i', 'l', 'f'}:
-                    c_char_buf = bytes(str(param_val), 'ascii')
-                    c_buf_len = len(c_char_buf)
-                elif param_types_0 in {'s', 'S'}:
-                    c_char_buf = param_val
-                    c_buf_len = len(c_char_buf)
-                elif param_types_0 in {'u', 'U'}:
-                    c_char_buf = ucs_buf(param_val)
-                    c_buf_len = len(c_char_buf)
-                elif param_types_0 == 'dt':
-                    c_char_buf = bytes(param_val.strftime('%Y-%m-%d %H:%M:%S.%f')[:self.connection.type_size_dic[SQL_TYPE_TIMESTAMP][0]], 'ascii')
-                    c_buf_len = len(c_char_buf)
-                    # print c_buf_len, c_char_buf
-                elif param_types_0 == 'd':
-                    c_char_buf = bytes(param_val.isoformat()[:self.connection.type_size_dic[SQL_TYPE_DATE][0] if SQL_TYPE_DATE in self.connection.type_size_dic else 10], 'ascii')
-                    c_buf_len = len(c_char_buf)
-                    # print c_char_buf
-                elif param_types_0 == 't':
-                    if SQL_TYPE_TIME in self.connection.type_size_dic:
-                        c_char_buf = param_val.isoformat()[:self.connection.type_size_dic[SQL_TYPE_TIME][0]]
-                        c_buf_len = len(c_char_buf)
-                    elif SQL_SS_TIME2 in self.connection.type_size_dic:
-                        c_char_buf = param_val.isoformat()[:self.connection.type_size_dic[SQL_SS_TIME2][0]]
-                        c_buf_len = len(c_char_buf)
-                    else:
-                        c_buf_len = self.connection.type_size_dic[SQL_TYPE_TIMESTAMP][0]
-                        time_str = param_val.isoformat()
-                        if len(time_str) == 8:
-                            time_str += '.000'
-                        c_char_buf = f'1900-01-01 {time_str[:c_buf_len - 11]}'
-                    c_char_buf = bytes(c_char_buf, 'ascii')
-                    # print c_buf_len, c_char_buf
-                elif param_types_0 == 'b':
-                    c_char_buf = bytes('1' if param_val else '0', 'ascii')
-                    c_buf_len = 1
-                elif param_types_0 == 'D':  # Decimal
-                    digit_string = ''.join(str(x) for x in param_val.as_tuple()[1])
-                    digit_num, dec_num = param_types[col_num][1]
-                    if dec_num > 0:
-                        # has decimal
-                        # 1.12 digit_num = 3 dec_num = 2
-                        # 0.11 digit_num = 2 dec_num = 2
-                        # 0.01 digit_num = 1 dec_num = 2
-                        v = f'{param_val.as_tuple()[0] == 0 and "+" or "-"}{digit_string[:digit_num - dec_num]}.{digit_string[0 - dec_num:].zfill(dec_num)}'
-                    else:
-                        # no decimal
-                        v = f'{digit_string}{"0" * (0 - dec_num)}'
-                    c_char_buf = bytes(v, 'ascii')
-                    c_buf_len = len(c_char_buf)
-                elif param_types_0 == 'bi':
-                    c_char_buf = bytes(param_val)
-                    c_buf_len = len(c_char_buf)
-                else:
-                    c_char_buf = param_val
+                if sql_c_type in NATIVE_C_TYPES:
+                    # packed straight into the bound struct, nothing to format here or parse in the driver
+                    pack_native(param_buffer, 0, param_val, sql_c_type, buf_size, dec_num)
+                    param_buffer_len.value = len(param_buffer)
+                    col_num += 1
+                    continue
+                c_char_buf, c_buf_len = self._param_data(param_val, param_types[col_num])
                 if param_types_0 == 'bi':
                     param_buffer.raw = bytes(param_val)
                 else:
@@ -980,7 +1108,10 @@ class Cursor:
             if not many_mode:
                 self._update_desc()
         else:
-            self._free_stmt()
+            self._release_prepared()
+            if not self._clean:
+                self._free_stmt()
+            self._clean = False
             self._last_param_types = None
             self.statement = None
             if isinstance(query_string, str):
@@ -991,16 +1122,226 @@ class Cursor:
             self._update_desc()
         return self
 
+    def _param_data(self, param_val, param_type):
+        """The value written to a parameter buffer for param_val, and its length"""
+        c_char_buf, c_buf_len = '', 0
+        param_types_0 = param_type[0]
+        if param_types_0 in {'i', 'l', 'f'}:
+            c_char_buf = bytes(str(param_val), 'ascii')
+            c_buf_len = len(c_char_buf)
+        elif param_types_0 in {'s', 'S'}:
+            c_char_buf = param_val
+            c_buf_len = len(c_char_buf)
+        elif param_types_0 in {'u', 'U'}:
+            c_char_buf = ucs_buf(param_val)
+            c_buf_len = len(c_char_buf)
+        elif param_types_0 == 'dt':
+            c_char_buf = bytes(param_val.strftime('%Y-%m-%d %H:%M:%S.%f')[:self.connection.type_size_dic[SQL_TYPE_TIMESTAMP][0]], 'ascii')
+            c_buf_len = len(c_char_buf)
+            # print c_buf_len, c_char_buf
+        elif param_types_0 == 'd':
+            c_char_buf = bytes(param_val.isoformat()[:self.connection.type_size_dic[SQL_TYPE_DATE][0] if SQL_TYPE_DATE in self.connection.type_size_dic else 10], 'ascii')
+            c_buf_len = len(c_char_buf)
+            # print c_char_buf
+        elif param_types_0 == 't':
+            if SQL_TYPE_TIME in self.connection.type_size_dic:
+                c_char_buf = param_val.isoformat()[:self.connection.type_size_dic[SQL_TYPE_TIME][0]]
+                c_buf_len = len(c_char_buf)
+            elif SQL_SS_TIME2 in self.connection.type_size_dic:
+                c_char_buf = param_val.isoformat()[:self.connection.type_size_dic[SQL_SS_TIME2][0]]
+                c_buf_len = len(c_char_buf)
+            else:
+                c_buf_len = self.connection.type_size_dic[SQL_TYPE_TIMESTAMP][0]
+                time_str = param_val.isoformat()
+                if len(time_str) == 8:
+                    time_str += '.000'
+                c_char_buf = f'1900-01-01 {time_str[:c_buf_len - 11]}'
+            c_char_buf = bytes(c_char_buf, 'ascii')
+            # print c_buf_len, c_char_buf
+        elif param_types_0 == 'b':
+            c_char_buf = bytes('1' if param_val else '0', 'ascii')
+            c_buf_len = 1
+        elif param_types_0 == 'D':  # Decimal
+            digit_string = ''.join(str(x) for x in param_val.as_tuple()[1])
+            digit_num, dec_num = param_type[1]
+            if dec_num > 0:
+                # has decimal
+                # 1.12 digit_num = 3 dec_num = 2
+                # 0.11 digit_num = 2 dec_num = 2
+                # 0.01 digit_num = 1 dec_num = 2
+                v = f'{param_val.as_tuple()[0] == 0 and "+" or "-"}{digit_string[:digit_num - dec_num]}.{digit_string[0 - dec_num:].zfill(dec_num)}'
+            else:
+                # no decimal
+                v = f'{digit_string}{"0" * (0 - dec_num)}'
+            c_char_buf = bytes(v, 'ascii')
+            c_buf_len = len(c_char_buf)
+        elif param_types_0 == 'bi':
+            c_char_buf = bytes(param_val)
+            c_buf_len = len(c_char_buf)
+        else:
+            c_char_buf = param_val
+        return c_char_buf, c_buf_len
+
+    def _use_prepared(self, query_string):
+        """Switch to the connection's prepared handle for query_string, preparing and caching one when there is none free"""
+        self._release_prepared()
+        if not self._clean:
+            # rows left unread on the own handle keep the connection busy, drivers without MARS refuse any other statement
+            self._free_stmt(SQL_CLOSE)
+        statements = self.connection.statements
+        prepared = statements.get(query_string)
+        if prepared is None and self.connection.statement_cache_size > 0:
+            stmt_h = ctypes.c_void_p()
+            check_success(self, ODBC_API.SQLAllocHandle(SQL_HANDLE_STMT, self.connection.dbc_h, ADDR(stmt_h)))
+            self.stmt_h = stmt_h
+            try:
+                if self.timeout != 0:
+                    self.set_timeout(self.timeout)
+                self.prepare(query_string)
+            except Exception:
+                self.stmt_h = self._own_stmt_h
+                ODBC_API.SQLFreeHandle(SQL_HANDLE_STMT, stmt_h)
+                raise
+            prepared = statements[query_string] = PreparedStatement(stmt_h, query_string, self._param_sql_type_list)
+            prepared.in_use = True  # so making room can't evict it
+            self.connection.evict_statements()
+        elif prepared is None or prepared.in_use:
+            # cache disabled, or another cursor on this connection has the statement open
+            self.prepare(query_string)
+            return
+        statements.move_to_end(query_string)
+        prepared.in_use = True
+        self._prepared = prepared
+        self.stmt_h = prepared.stmt_h
+        self.statement = query_string
+        self._param_sql_type_list = prepared.param_sql_type_list
+        self._last_param_types = prepared.last_param_types
+        self._param_buffer_list = prepared.param_buffer_list
+
+    def _release_prepared(self):
+        """Hand the cached prepared handle back with its bindings and go back to the cursor's own handle"""
+        self._end_block()
+        prepared = self._prepared
+        if prepared is None:
+            return
+        self._prepared = None
+        prepared.last_param_types, prepared.param_buffer_list = self._last_param_types, self._param_buffer_list
+        if self.connection.connected:
+            # the column buffers belong to this cursor, they must not stay bound once it lets go
+            for free_type in (SQL_CLOSE, SQL_UNBIND):
+                check_success(self, ODBC_API.SQLFreeStmt(prepared.stmt_h, free_type))
+        prepared.in_use = False
+        self.stmt_h = self._own_stmt_h
+        self.statement = None
+        self._last_param_types = None
+        self._param_buffer_list = []
+        self._param_sql_type_list = []
+
     def executemany(self, query_string, params_list=None):
         if params_list is None:
             params_list = [None]
         if not self.connection:
             self.close()
-        for params in params_list:
+        params_list, done = list(params_list), 0
+        if len(params_list) > 1 and all(params_list):
+            # PARAM_ARRAY_SIZE rows per SQLExecute, what can't go as an array (driver support, mixed types) goes row by row below
+            while done < len(params_list) and self.connection.param_array_size > 1 and self._execute_array(query_string, params_list[done:done + self.connection.param_array_size], done):
+                done += self.connection.param_array_size
+        for params in params_list[done:]:
             self.execute(query_string, params, many_mode=True)
         self.rowcount = -1
         self._update_desc()
 
+    def _execute_array(self, query_string, params_list, offset=0):
+        """Bind params_list column-wise as parameter arrays and execute it once, False when it has to go row by row"""
+        if not isinstance(params_list[0], (tuple, list)) or any(not isinstance(params, (tuple, list)) or len(params) != len(params_list[0]) for params in params_list):
+            return False
+        row_types = [[get_type(_) for _ in params] for params in params_list]
+        param_types = [get_array_type([types[col_num] for types in row_types]) for col_num in range(len(params_list[0]))]
+        if None in param_types:
+            return False
+        if query_string != self.statement:
+            self._use_prepared(query_string)
+        else:
+            self._free_stmt(SQL_CLOSE)
+        num_params = C_SHORT()
+        check_success(self, ODBC_API.SQLNumParams(self.stmt_h, ADDR(num_params)))
+        if len(param_types) != num_params.value:
+            raise ProgrammingError('HY000', f'The SQL contains {num_params.value} parameter markers, but {len(param_types)} parameters were supplied')
+        # the single row buffers are replaced, the next execute binds again
+        self._free_stmt(SQL_RESET_PARAMS)
+        self._last_param_types = None
+        self._param_buffer_list = []
+        size = len(params_list)
+        status = (ctypes.c_ushort * size)()
+        processed = ctypes.c_size_t()
+        try:
+            if not self._set_param_array(size, status, processed):
+                # the driver doesn't take parameter arrays, stop trying on this connection
+                self.connection.param_array_size = 0
+                return False
+            buffers = []
+            for col_num, (sql_c_type, sql_type, buf_size, dec_num, native_buffer) in enumerate(self._param_bindings(param_types)):
+                if sql_c_type in NATIVE_C_TYPES:
+                    # fixed size C types, the driver steps through the array by the size of the struct
+                    width = len(native_buffer)
+                    param_buffer = CREATE_BUFFER(width * size)
+                    len_or_ind_buf = (C_SSIZE_T * size)()
+                    for row, (params, types) in enumerate(zip(params_list, row_types)):
+                        if types[col_num][0] in {'N', 'BN'}:
+                            len_or_ind_buf[row] = SQL_NULL_DATA
+                        else:
+                            pack_native(param_buffer, row * width, params[col_num], sql_c_type, buf_size, dec_num)
+                            len_or_ind_buf[row] = width
+                    self._bind_param(col_num, 1, sql_c_type, sql_type, buf_size, dec_num, param_buffer, width, len_or_ind_buf)
+                    buffers.append((param_buffer, len_or_ind_buf))
+                    continue
+                values = []
+                for params, types in zip(params_list, row_types):
+                    param_types_0 = types[col_num][0]
+                    if param_types_0 in {'N', 'BN'}:
+                        values.append(None)
+                    elif param_types_0 in {'u', 'U'}:
+                        values.append(params[col_num].encode(ODBC_ENCODING))
+                    else:
+                        values.append(bytes(self._param_data(params[col_num], types[col_num])[0]))
+                # every row gets a slot as long as the longest value, lengths go in the indicator array
+                width = max([buf_size, 1] + [len(_) for _ in values if _ is not None])
+                param_buffer = CREATE_BUFFER(width * size)
+                len_or_ind_buf = (C_SSIZE_T * size)()
+                for row, value in enumerate(values):
+                    if value is None:
+                        len_or_ind_buf[row] = SQL_NULL_DATA
+                    else:
+                        ctypes.memmove(ctypes.addressof(param_buffer) + row * width, value, len(value))
+                        len_or_ind_buf[row] = len(value)
+                self._bind_param(col_num, 1, sql_c_type, sql_type, buf_size, dec_num, param_buffer, width, len_or_ind_buf)
+                buffers.append((param_buffer, len_or_ind_buf))
+            ret = SQL_EXECUTE(self.stmt_h)
+            if ret not in (SQL_SUCCESS, SQL_SUCCESS_WITH_INFO, SQL_NO_DATA):
+                failed = [offset + row for row in range(processed.value or size) if status[row] in {SQL_PARAM_ERROR, SQL_PARAM_DIAG_UNAVAILABLE}]
+                try:
+                    # check_success takes SQL_ERROR for SQL_NULL_DATA, failed rows must not pass silently
+                    ctrl_err(SQL_HANDLE_STMT, self.stmt_h, self.ansi)
+                    raise DatabaseError('', 'SQL_ERROR')
+                except Error as e:
+                    # which rows of params_list the driver reported as failing
+                    e.rows = failed
+                    e.value = e.args = (e.value[0], f'{e.value[1]} (failed rows: {failed})')
+                    raise
+            return True
+        finally:
+            # the arrays go away with this call, the handle must not point at them
+            self._set_param_array(1, None, None)
+            self._free_stmt(SQL_RESET_PARAMS)
+
+    def _set_param_array(self, size, status, processed):
+        """Set the parameter array size and where the driver reports per row status and rows processed, False when the driver refuses"""
+        for attr, value in ((SQL_ATTR_PARAMSET_SIZE, size), (SQL_ATTR_PARAM_STATUS_PTR, status), (SQL_ATTR_PARAMS_PROCESSED_PTR, processed)):
+            if ODBC_API.SQLSetStmtAttr(self.stmt_h, attr, value if value is None or isinstance(value, int) else ctypes.addressof(value), 0) != SQL_SUCCESS:
+                return False
+        return True
+
     def _create_col_buf(self):
         if not self.connection:
             self.close()
@@ -1023,16 +1364,25 @@ class Cursor:
                 dynamic_length = True
             alloc_buffer = SQL_DATA_TYPE_DICT[col_sql_data_type][3](total_buf_len)
             used_buf_len = C_SSIZE_T()
+            buf_cvt_func = self.connection.output_converter[col_sql_data_type]
             if col_sql_data_type in {SQL_CHAR, SQL_VARCHAR, SQL_LONGVARCHAR}:
                 target_type = SQL_C_WCHAR
                 alloc_buffer = CREATE_BUFFER_U(total_buf_len)
             if bind_data and dynamic_length:
                 bind_data = False
-            self._col_buffer_list.append([self.description[col_num][0], target_type, used_buf_len, ADDR(used_buf_len), alloc_buffer, ADDR(alloc_buffer), total_buf_len, self.connection.output_converter[self._col_type_code_list[col_num]], bind_data])
+            if self.connection.native_types and col_sql_data_type in SQL_NATIVE_TYPE_DICT and buf_cvt_func is SQL_DATA_TYPE_DICT[col_sql_data_type][1] and (bind_data or col_sql_data_type not in {SQL_NUMERIC, SQL_DECIMAL}):
+                # numerics need their precision and scale set on the bound column, SQLGetData would fetch them with the driver's default scale
+                target_type, buf_cvt_func, total_buf_len = SQL_NATIVE_TYPE_DICT[col_sql_data_type]
+                alloc_buffer = CREATE_BUFFER(total_buf_len)
+            self._col_buffer_list.append([self.description[col_num][0], target_type, used_buf_len, ADDR(used_buf_len), alloc_buffer, ADDR(alloc_buffer), total_buf_len, buf_cvt_func, bind_data])
             if bind_data:
-                ret = ODBC_API.SQLBindCol(self.stmt_h, col_num + 1, target_type, ADDR(alloc_buffer), total_buf_len, ADDR(used_buf_len))
-                if ret != SQL_SUCCESS:
-                    check_success(self, ret)
+                self._bind_col(col_num, target_type, alloc_buffer, total_buf_len, ADDR(used_buf_len))
+
+    def _bind_col(self, col_num, target_type, buffer, buf_len, len_or_ind_buf):
+        """SQLBindCol, numerics also get the column's precision and scale through the row descriptor"""
+        check_success(self, ODBC_API.SQLBindCol(self.stmt_h, col_num + 1, target_type, ADDR(buffer), buf_len, len_or_ind_buf))
+        if target_type == SQL_C_NUMERIC:
+            self._set_numeric_desc(SQL_ATTR_APP_ROW_DESC, col_num, self.description[col_num][4], self.description[col_num][5], buffer)
 
     def _update_desc(self):
         """Get the information of (name, type_code, display_size, internal_size, col_precision, scale, null_ok)"""
@@ -1085,10 +1435,31 @@ class Cursor:
             check_success(self, ret)
         return noc.value
 
-    def fetchall(self):
+    def fetchmany(self, size=1):
         if not self.connection:
             self.close()
+        if size > 1 and self._block is None and not self._pending:
+            self._start_block()
         rows = []
+        while len(rows) < size:
+            row = self.fetchone()
+            if row is None:
+                break
+            rows.append(row)
+        return rows
+
+    def fetchall(self):
+        if not self.connection:
+            self.close()
+        if self._block is None and not self._pending:
+            self._start_block()
+        rows = list(self._pending)
+        self._pending.clear()
+        if self._block is not None:
+            while self._fetch_block():
+                rows.extend(self._pending)
+                self._pending.clear()
+            return rows
         while True:
             row = self.fetchone()
             if row is None:
@@ -1096,9 +1467,94 @@ class Cursor:
             rows.append(row)
         return rows
 
+    def _start_block(self):
+        """Rebind the result set's columns as arrays of row_array_size rows for SQLFetchScroll, False when it has to be fetched row by row"""
+        size = self.connection.row_array_size
+        if size <= 1 or not self.description or not self._col_buffer_list:
+            return False
+        columns = []
+        for col_num, (col_name, target_type, _, _, _, _, total_buf_len, buf_cvt_func, _) in enumerate(self._col_buffer_list):
+            display_size = self.description[col_num][2]
+            width = total_buf_len
+            if target_type not in NATIVE_C_TYPES:
+                # wide columns are read with SQLGetData one row at a time, which block cursors can't do, so text and binary need a size to bind with
+                if not 0 < display_size < 1024:
+                    return False
+                width = min(total_buf_len, (display_size + 1) * UCS_LENGTH)
+            columns.append((col_name, target_type, CREATE_BUFFER(width * size), (C_SSIZE_T * size)(), width, buf_cvt_func))
+        status = (ctypes.c_ushort * size)()
+        fetched = ctypes.c_size_t()
+        if not self._set_row_array(size, status, fetched):
+            # the driver doesn't do block cursors, stop trying on this connection
+            self._set_row_array(1, None, None)
+            self.connection.row_array_size = 0
+            return False
+        self._block = (columns, status, fetched)
+        self._free_stmt(SQL_UNBIND)
+        for col_num, (_, target_type, buffer, len_or_ind_buf, width, _) in enumerate(columns):
+            self._bind_col(col_num, target_type, buffer, width, len_or_ind_buf)
+        return True
+
+    def _fetch_block(self):
+        """Fetch the next rowset into self._pending, False at the end of the result set"""
+        columns, status, fetched = self._block
+        ret = ODBC_API.SQLFetchScroll(self.stmt_h, SQL_FETCH_NEXT, 0)
+        if ret not in (SQL_SUCCESS, SQL_SUCCESS_WITH_INFO):
+            if ret != SQL_NO_DATA:
+                check_success(self, ret)
+            return False
+        num_rows = fetched.value
+        values = []
+        for col_name, target_type, buffer, len_or_ind_buf, width, buf_cvt_func in columns:
+            # one copy of the whole column instead of a ctypes call per value
+            raw, column = buffer.raw, []
+            room = width if target_type == SQL_C_BINARY else width - (UCS_LENGTH if target_type == SQL_C_WCHAR else 1)
+            for row, used in enumerate(len_or_ind_buf[:num_rows]):
+                if used == SQL_NULL_DATA:
+                    column.append(None)
+                elif target_type in NATIVE_C_TYPES:
+                    column.append(buf_cvt_func(raw[row * width:(row + 1) * width]))
+                elif not 0 <= used <= room:
+                    raise DataError('01004', f'[01004] {col_name} holds more than the {room} bytes its display size allows, set row_array_size to 0 to fetch it row by row')
+                elif target_type == SQL_C_WCHAR:
+                    column.append(buf_cvt_func(raw[row * width:row * width + used].decode(ODBC_ENCODING)))
+                else:
+                    column.append(buf_cvt_func(raw[row * width:row * width + used]))
+            values.append(column)
+        for row, value_list in enumerate(map(list, zip(*values))):
+            if status[row] == SQL_ROW_ERROR:
+                ctrl_err(SQL_HANDLE_STMT, self.stmt_h, self.ansi)
+            if status[row] not in {SQL_ROW_NOROW, SQL_ROW_ERROR}:
+                self._pending.append(self._row_type(value_list))
+        return True
+
+    def _end_block(self):
+        """Unbind the rowset arrays and go back to fetching one row at a time"""
+        self._pending.clear()
+        if self._block is None:
+            return
+        self._block = None
+        if self.connection.connected:
+            self._set_row_array(1, None, None)
+            check_success(self, ODBC_API.SQLFreeStmt(self.stmt_h, SQL_UNBIND))
+
+    def _set_row_array(self, size, status, fetched):
+        """Set the rowset size and where the driver reports per row status and rows fetched, False when the driver refuses"""
+        for attr, value in ((SQL_ATTR_ROW_ARRAY_SIZE, size), (SQL_ATTR_ROW_STATUS_PTR, status), (SQL_ATTR_ROWS_FETCHED_PTR, fetched)):
+            if ODBC_API.SQLSetStmtAttr(self.stmt_h, attr, value if value is None or isinstance(value, int) else ctypes.addressof(value), 0) != SQL_SUCCESS:
+                return False
+        return True
+
     def fetchone(self):
         if not self.connection:
             self.close()
+        if self._block is not None:
+            while not self._pending and self._fetch_block():
+                pass
+        if self._pending:
+            return self._pending.popleft()
+        if self._block is not None:
+            return None
         ret = ODBC_API.SQLFetch(self.stmt_h)
         if ret in (SQL_SUCCESS, SQL_SUCCESS_WITH_INFO):
             '''Bind buffers for the record set columns'''
@@ -1117,7 +1573,9 @@ class Cursor:
                         else:
                             if not raw_data_parts:
                                 # Means no previous data, no need to combine
-                                if target_type == SQL_C_BINARY:
+                                if target_type in NATIVE_C_TYPES:
+                                    value_list.append(buf_cvt_func(alloc_buffer.raw[:total_buf_len]))
+                                elif target_type == SQL_C_BINARY:
                                     value_list.append(buf_cvt_func(alloc_buffer.raw[:used_buf_len.value]))
                                 elif target_type == SQL_C_WCHAR:
                                     if used_buf_len.value < total_buf_len:
@@ -1170,6 +1628,7 @@ class Cursor:
         # self.description = None
         # self.rowcount = -1
         if free_type in {SQL_CLOSE, None}:
+            self._end_block()
             ret = ODBC_API.SQLFreeStmt(self.stmt_h, SQL_CLOSE)
             if ret != SQL_SUCCESS:
                 check_success(self, ret)
@@ -1185,6 +1644,7 @@ class Cursor:
     def get_type_info(self, sql_type=None):
         if not self.connection:
             self.close()
+        self._clean = False
         if ODBC_API.SQLGetTypeInfo(self.stmt_h, sql_type or 0) in {SQL_SUCCESS, SQL_SUCCESS_WITH_INFO}:
             self._update_desc()
             return self.fetchone()
@@ -1203,10 +1663,18 @@ class Cursor:
         """Call SQLCloseCursor API to free the statement handle"""
         #        ret = ODBC_API.SQLCloseCursor(self.stmt_h)
         #        check_success(self, ret)
+        if self.closed:
+            return
+        self._release_prepared()
+        self._end_block()
         if self.connection.connected:
-            for _ in (SQL_CLOSE, SQL_UNBIND, SQL_RESET_PARAMS):
-                check_success(self, ODBC_API.SQLFreeStmt(self.stmt_h, _))
-            check_success(self, ODBC_API.SQLFreeHandle(SQL_HANDLE_STMT, self.stmt_h))
+            if not self._clean:
+                for _ in (SQL_CLOSE, SQL_UNBIND, SQL_RESET_PARAMS):
+                    check_success(self, ODBC_API.SQLFreeStmt(self.stmt_h, _))
+            if len(self.connection.handles) < self.connection.handle_pool_size:
+                self.connection.handles.append((self.stmt_h, self.timeout))
+            else:
+                check_success(self, ODBC_API.SQLFreeHandle(SQL_HANDLE_STMT, self.stmt_h))
         self.closed = True
 
     def __del__(self):
@@ -1239,6 +1707,13 @@ class Connection:
         self.readonly = False
         # the query timeout value
         self.timeout = 0
+        self.statements = OrderedDict()  # sql -> PreparedStatement, least recently used first
+        self.statement_cache_size = STATEMENT_CACHE_SIZE
+        self.handles = []  # (stmt_h, timeout) closed cursors left reset for the next ones
+        self.handle_pool_size = STATEMENT_HANDLE_POOL_SIZE
+        self.param_array_size = PARAM_ARRAY_SIZE  # set to 0 once the driver refuses parameter arrays
+        self.row_array_size = ROW_ARRAY_SIZE  # set to 0 once the driver refuses block cursors
+        self.native_types = NATIVE_TYPES
         # self._cursors = []
         connect_string += ';'.join(f'{k}={v}' for k, v in kargs.items())
         self.connectString = connect_string
@@ -1291,7 +1766,7 @@ class Connection:
         # or:
         #    [01000] [unixODBC][Driver Manager]Can't open lib '/path/to/so' : (null)"
         # when called concurrently by more than one threads. So, we have to use a lock to serialize the calls. By the way, the error is much less likely to happen if ODBC Tracing is enabled, likely due to the implicit serialization caused by writing to trace file.
-        if ODBC_API._name != 'odbc32':
+        if ODBC_API._name != 'odbc32' and SERIALIZE_CONNECT:
             try:
                 LOCK.acquire()
                 ret = odbc_func(self.dbc_h, 0, c_connect_string, len(self.connectString), None, 0, None, SQL_DRIVER_NOPROMPT)
@@ -1334,6 +1809,11 @@ class Connection:
             raise ProgrammingError('HY000', 'Attempt to use a closed connection.')
         return Cursor(self, row_type_callable=row_type_callable)
 
+    def evict_statements(self):
+        """Free the least recently used prepared statements that aren't in use until the cache fits statement_cache_size"""
+        for statement in [k for k, v in self.statements.items() if not v.in_use][:max(0, len(self.statements) - self.statement_cache_size)]:
+            check_success(self, ODBC_API.SQLFreeHandle(SQL_HANDLE_STMT, self.statements.pop(statement).stmt_h))
+
     def update_db_special_info(self):
         try:
             if 'OdbcFb' in self.getinfo(SQL_DRIVER_NAME):
@@ -1414,6 +1894,8 @@ class Connection:
         if self.connected:
             if not self.autocommit:
                 self.rollback()
+            self.statements.clear()  # SQLDisconnect frees every statement handle
+            self.handles.clear()
             check_success(self, ODBC_API.SQLDisconnect(self.dbc_h))
         check_success(self, ODBC_API.SQLFreeHandle(SQL_HANDLE_DBC, self.dbc_h))
         #        if shared_env_h.value:
@@ -1434,6 +1916,17 @@ def allocate_env():
     check_success(SHARED_ENV_H, ODBC_API.SQLSetEnvAttr(SHARED_ENV_H, 200, 3, 0))
 
 
+def _after_fork():
+    # the child must not share the parent's environment handle or a lock that may have been held while forking, a new environment is allocated on the next connect
+    global SHARED_ENV_H, LOCK
+    SHARED_ENV_H = None
+    LOCK = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
 def drivers():
     if sys.platform not in {'win32', 'cli'}:
         raise Exception('This function is available for use in Windows only.')
@@ -20,13 +20,12 @@ setuptools.setup(
         "Development Status :: 5 - Production/Stable",
         "Intended Audience :: Developers",
         "Programming Language :: Python :: 3 :: Only",
-        "Programming Language :: Python :: 3.6",
         "Programming Language :: Python :: 3.7",
         "Programming Language :: Python :: 3.8",
         "Programming Language :: Python :: Implementation :: CPython",
         "Topic :: Database"
     ],
-    python_requires='>=3.6',
+    python_requires='>=3.7',
     package_data={'litespeed': ['html/*.html']},
     include_package_data=True
 )